@@ -1,13 +1,40 @@
 import os
+import secrets
+import threading
 import time
-from typing import List, Any
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-
-from .query_faiss import FAISSQuery
+from typing import Any, AsyncGenerator, List
+
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from .cache_warming import CacheWarmer
+from .collection_store import (
+    BUCKET_NAME,
+    DEFAULT_COLLECTION,
+    PINNED_COLLECTIONS,
+    SKIP_GCS_DOWNLOAD,
+    CollectionNotFoundError,
+    CollectionStore,
+    InvalidCollectionError,
+)
+from .ingest_jobs import (
+    ALLOWED_EXTENSIONS,
+    INGEST_API_KEY,
+    INGEST_MAX_UPLOAD_MB,
+    IngestJobManager,
+    IngestQueueFullError,
+)
+from .query_faiss import RANGE_MAX_RESULTS, FAISSQuery
 from .llm_wrapper import generate_answer
-from .gcs_utils import download_file_from_gcs, file_exists_in_gcs
+from .metrics import INFLIGHT_REQUESTS, collect_stage_timings, stage_timer
+from .query_log import QUERY_LOG_ENABLED, QUERY_LOG_GCS_PATH, QueryLog
+from .rerank import RERANK_CANDIDATES, RERANK_ENABLED, Reranker
+from .resilience import CircuitOpenError, UpstreamError, UpstreamTimeoutError
 
 from fastapi.staticfiles import StaticFiles
 
@@ -17,69 +44,107 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# frontend klasörünü /web altında servis et
-app.mount("/web", StaticFiles(directory="frontend", html=True), name="frontend")
+# frontend klasörünü /web altında servis et (cwd'den bağımsız)
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+app.mount("/web", StaticFiles(directory=FRONTEND_DIR, html=True, check_dir=False), name="frontend")
 
 
 # ==========
-# GCS & FAISS paths
+# Collections (one FAISS index per course)
 # ==========
-BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "rag-documents-bucket-icu")
+# Collection'lar ilk istekte GCS'den yüklenir, LRU + memory budget ile tutulur
+collection_store = CollectionStore()
 
-LOCAL_INDEX_PATH = "data/faiss_index.bin"
-LOCAL_METADATA_PATH = "data/faiss_metadata.json"
-LOCAL_CHUNKS_PATH = "data/chunks.json"
+# Soru frekans logu (GCS'te kalıcı) + cold start / hot swap sonrası cache warming
+query_log = QueryLog(gcs_path=None if SKIP_GCS_DOWNLOAD else QUERY_LOG_GCS_PATH, bucket_name=BUCKET_NAME)
+cache_warmer = CacheWarmer(lambda collection_id: collection_store.get(collection_id), query_log)
 
-GCS_INDEX_PATH = "faiss/faiss_index.bin"
-GCS_METADATA_PATH = "faiss/faiss_metadata.json"
-GCS_CHUNKS_PATH = "faiss/chunks.json"
+# Upload → parse → embed → index → publish işleri, /ask'tan izole worker pool'da;
+# yeni index yayınlanınca sık sorulan sorular tekrar ısıtılır
+ingest_manager = IngestJobManager(collection_store, on_published=cache_warmer.schedule)
 
-# FAISSQuery global (startup'ta initialize edilecek)
-faiss_query: FAISSQuery | None = None
+# FAISS sonuçlarını CPU cross-encoder ile yeniden sıralar; Gemini'ye sadece
+# en iyi RERANK_TOP_N passage gider (model startup'ta arka planda yüklenir)
+reranker = Reranker()
+
+
+# Pinned collection'ların yükleme durumu (/ready)
+startup_errors: dict[str, str] = {}
 
 
 @app.on_event("startup")
 async def startup_event() -> None:
     """
-    Container cold start olduğunda 1 kere çalışır:
-    1. GCS'den FAISS index + metadata + chunks dosyalarını indirir
+    Container cold start olduğunda 1 kere çalışır.
+    Index yüklemesini background thread'de başlatır ve hemen döner,
+    böylece /health index yüklenmeden cevap verir (/ready yüklenince 200 döner).
+    """
+    threading.Thread(target=load_pinned_collections, name="load-collections", daemon=True).start()
+    if not SKIP_GCS_DOWNLOAD:
+        # Başka instance'ların publish ettiği versiyonlar COLLECTION_REFRESH_S içinde yüklenir
+        collection_store.start_refresher(on_refreshed=cache_warmer.schedule)
+    if RERANK_ENABLED:
+        # Model yüklenene kadar /ask FAISS sırasıyla cevap verir
+        reranker.start_loading()
+
+
+@app.on_event("shutdown")
+def shutdown_event() -> None:
+    ingest_manager.shutdown()
+    collection_store.stop()
+    cache_warmer.shutdown()
+    if QUERY_LOG_ENABLED:
+        query_log.stop()
+        try:
+            query_log.flush()
+        except Exception as e:
+            print(f"[QUERY LOG] Final flush failed: {e!r}")
+
+
+def load_pinned_collections() -> None:
+    """
+    Pinned collection'ları (default: DEFAULT_COLLECTION) yükler:
+    1. GCS'den FAISS index + metadata (+ chunks) dosyalarını indirir
+       (SKIP_GCS_DOWNLOAD=1 ise atlanır)
     2. FAISSQuery'yi bu dosyalar üzerinden initialize eder
+    3. Query log'u yükler ve yüklenen collection'lar için en sık soruların
+       embedding + retrieval sonuçlarını arka planda hesaplar (cache warming)
+    Diğer collection'lar ilk /ask isteğinde lazy yüklenir.
     """
-    print("[STARTUP] Downloading FAISS assets from GCS...")
-
-    # 1) GCS'de dosyalar var mı kontrol et ve indir
-    if not file_exists_in_gcs(GCS_INDEX_PATH):
-        print(f"[ERROR] FAISS index not found in GCS: gs://{BUCKET_NAME}/{GCS_INDEX_PATH}")
-        # Burada return dersen FAISSQuery hiç yüklenmez; loglayıp devam ediyoruz
-    else:
-        download_file_from_gcs(GCS_INDEX_PATH, LOCAL_INDEX_PATH, BUCKET_NAME)
-
-    if file_exists_in_gcs(GCS_METADATA_PATH):
-        download_file_from_gcs(GCS_METADATA_PATH, LOCAL_METADATA_PATH, BUCKET_NAME)
-    else:
-        print(f"[WARN] Metadata not found in GCS: gs://{BUCKET_NAME}/{GCS_METADATA_PATH}")
-
-    if file_exists_in_gcs(GCS_CHUNKS_PATH):
-        download_file_from_gcs(GCS_CHUNKS_PATH, LOCAL_CHUNKS_PATH, BUCKET_NAME)
-    else:
-        print(f"[WARN] Chunks not found in GCS: gs://{BUCKET_NAME}/{GCS_CHUNKS_PATH}")
-
-    # 2) FAISSQuery'yi initialize et
-    global faiss_query
+    loaded = []
+    for collection_id in PINNED_COLLECTIONS:
+        try:
+            collection_store.get(collection_id)
+            startup_errors.pop(collection_id, None)
+            loaded.append(collection_id)
+            print(f"[STARTUP] Collection '{collection_id}' loaded.")
+        except Exception as e:
+            # Loglayıp devam ediyoruz; /ask ilk istekte tekrar dener
+            startup_errors[collection_id] = str(e)
+            print(f"[ERROR] Failed to load collection '{collection_id}': {e}")
+
+    if not QUERY_LOG_ENABLED:
+        return
     try:
-        faiss_query = FAISSQuery(
-            index_path=LOCAL_INDEX_PATH,
-            metadata_path=LOCAL_METADATA_PATH,
-        )
-        print("[STARTUP] FAISSQuery initialized successfully.")
+        print(f"[STARTUP] Query log loaded ({query_log.load()} questions).")
     except Exception as e:
-        print(f"[ERROR] Failed to initialize FAISSQuery: {e}")
-        faiss_query = None
+        # Log yoksa / okunamazsa warming atlanır, kayıt yine de devam eder
+        print(f"[WARN] Failed to load query log: {e!r}")
+    query_log.start_flusher()
+    for collection_id in loaded:
+        cache_warmer.schedule(collection_id)
 
 
 class AskRequest(BaseModel):
     question: str
     top_k: int = 5
+    # Course / collection ID; None → DEFAULT_COLLECTION
+    collection: str | None = None
+    # True → response'a stage bazında süreleri (embed/search/prompt/generate) ekle
+    include_timings: bool = False
+    # False → bu istek için rerank kapalı; RERANK_ENABLED=0 iken true yok sayılır
+    # (model yükletmek deployment'ın kararı, client'ın değil)
+    rerank: bool | None = None
 
 
 class Passage(BaseModel):
@@ -88,47 +153,324 @@ class Passage(BaseModel):
     page: int | None = None
     title: str | None = None
     distance: float | None = None
+    # Cross-encoder skoru (rerank yoksa / bütçe yetmediyse None)
+    rerank_score: float | None = None
 
 
 class AskResponse(BaseModel):
     question: str
+    collection: str
     answer: str
     time: float
     passages: List[Passage]
+    timings: dict[str, float] | None = None
+
+
+class SearchRequest(BaseModel):
+    query: str
+    collection: str | None = None
+    # Mesafe eşiği (Passage.distance ile aynı ölçek, küçük = daha yakın):
+    # verilirse sabit top_k yerine eşiğin altındaki tüm passage'lar döner
+    max_distance: float | None = Field(default=None, gt=0)
+    # max_distance yoksa kullanılır
+    top_k: int = Field(default=10, ge=1, le=RANGE_MAX_RESULTS)
+    # Sayfalama
+    offset: int = Field(default=0, ge=0)
+    limit: int = Field(default=10, ge=1, le=100)
+    include_timings: bool = False
+
+
+class SearchResponse(BaseModel):
+    query: str
+    collection: str
+    passages: List[Passage]
+    # Eşleşen toplam passage (top_k, ya da eşik altındakiler; en fazla RANGE_MAX_RESULTS)
+    total: int
+    offset: int
+    next_offset: int | None = None
+    time: float
+    timings: dict[str, float] | None = None
 
 
 @app.get("/health")
 def health_check() -> dict[str, str]:
     """
-    Simple health check endpoint.
+    Simple health check endpoint (liveness; does not wait for the index).
     """
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def readiness_check() -> JSONResponse:
+    """
+    Readiness: 200 once every pinned collection is loaded, 503 before that.
+    Rerank modeli readiness'i etkilemez (yoksa FAISS sırası kullanılır),
+    sadece durumu raporlanır.
+    """
+    missing = [c for c in PINNED_COLLECTIONS if c not in collection_store]
+    if not missing:
+        return JSONResponse({"status": "ready", "collections": PINNED_COLLECTIONS, "rerank": rerank_status()})
+
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "failed" if set(missing) <= set(startup_errors) else "loading",
+            "missing": missing,
+            "errors": {c: startup_errors[c] for c in missing if c in startup_errors},
+            "rerank": rerank_status(),
+        },
+    )
+
+
+def rerank_status() -> dict[str, Any]:
+    return {"enabled": RERANK_ENABLED, "ready": reranker.ready, "load_error": reranker.load_error}
+
+
+@app.get("/collections")
+def list_collections() -> dict[str, Any]:
+    """
+    Collections currently in memory (LRU order, oldest first) and the memory budget.
+    """
+    return {
+        "loaded": collection_store.loaded(),
+        "pinned": sorted(collection_store.pinned),
+        "max_bytes": collection_store.max_bytes,
+    }
+
+
+def require_ingest_key(x_api_key: str | None = Header(default=None)) -> None:
+    """
+    Upload / job endpoint'leri index'leri değiştirir: X-API-Key header'ı
+    INGEST_API_KEY ile eşleşmeli (401). Body okunmadan önce çalışır.
+    """
+    if not INGEST_API_KEY:
+        raise HTTPException(status_code=404, detail="Document ingestion is disabled on this deployment.")
+    if x_api_key is None or not secrets.compare_digest(x_api_key.encode(), INGEST_API_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing API key.")
+
+
+# INGEST_API_KEY tanımlı değilse bu route'lar hiç register edilmez (aşağıda)
+ingest_router = APIRouter(dependencies=[Depends(require_ingest_key)])
+
+# Multipart boundary'leri + part header'ları için dosyaların üstüne izin verilen pay
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+
+async def read_upload_form(request: Request, max_bytes: int) -> FormData:
+    """
+    Multipart body'yi en fazla max_bytes (+ overhead) okuyarak parse eder:
+    Content-Length limiti aşıyorsa hiç okumadan, chunked upload'larda limit
+    aşıldığı anda 413 döner (body hafızada / /tmp'de biriktirilmez).
+    """
+    limit = max_bytes + UPLOAD_OVERHEAD_BYTES
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds {INGEST_MAX_UPLOAD_MB:g} MB.")
+
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise too_large
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload.")
+
+    async def capped_stream() -> AsyncGenerator[bytes, None]:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise too_large
+            yield chunk
+
+    try:
+        return await MultiPartParser(request.headers, capped_stream(), max_files=100, max_fields=100).parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=f"Invalid multipart upload: {e.message}")
+
+
+@ingest_router.post("/collections/{collection_id}/documents", status_code=202)
+async def upload_documents(collection_id: str, request: Request) -> dict[str, Any]:
+    """
+    Queues PDF/TXT files (multipart field "files") for background ingestion
+    into a collection. Returns the job immediately (202); poll
+    GET /jobs/{job_id} for progress. The collection is hot-swapped when the
+    job succeeds.
+    """
+    max_bytes = int(INGEST_MAX_UPLOAD_MB * 1024 * 1024)
+    form = await read_upload_form(request, max_bytes)
+    files = [f for f in form.getlist("files") if isinstance(f, UploadFile)]
+    if not files:
+        raise HTTPException(status_code=400, detail='No files uploaded (multipart field "files").')
+
+    uploaded: dict[str, bytes] = {}
+    total = 0
+    try:
+        for f in files:
+            name = os.path.basename(f.filename or "")
+            if not name or os.path.splitext(name)[1].lower() not in ALLOWED_EXTENSIONS:
+                raise HTTPException(status_code=400, detail=f"Unsupported file {name!r}: only .pdf and .txt.")
+
+            content = await f.read(max_bytes - total + 1)
+            total += len(content)
+            if total > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {INGEST_MAX_UPLOAD_MB:g} MB.")
+            uploaded[name] = content
+    finally:
+        await form.close()
+
+    try:
+        job = await run_in_threadpool(ingest_manager.submit, collection_id, uploaded)
+    except InvalidCollectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IngestQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return job.to_dict()
+
+
+@ingest_router.get("/jobs")
+def list_jobs() -> list[dict[str, Any]]:
+    """
+    Recent ingestion jobs, newest first.
+    """
+    return [job.to_dict() for job in ingest_manager.list()]
+
+
+@ingest_router.get("/jobs/{job_id}")
+def get_job(job_id: str) -> dict[str, Any]:
+    """
+    Status + progress of one ingestion job.
+    """
+    job = ingest_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'.")
+    return job.to_dict()
+
+
+if INGEST_API_KEY:
+    app.include_router(ingest_router)
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    """
+    Prometheus metrics: per-stage latency histograms, cache hit rates,
+    in-flight requests and index size.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/ask", response_model=AskResponse)
 def ask_question(payload: AskRequest) -> AskResponse:
     """
     Main RAG endpoint:
-    1. Retrieves top-k passages from FAISS.
+    1. Retrieves top-k passages from FAISS
+       (rerank: RERANK_CANDIDATES passages, cross-encoder keeps the best RERANK_TOP_N).
     2. Sends them to Gemini via llm_wrapper.generate_answer.
-    3. Returns the answer + used passages.
+    3. Returns the answer + used passages
+       (+ per-stage timings if include_timings=True).
+    Gemini failures → 503 (504 on timeout) instead of an error string as the answer.
+    """
+    with INFLIGHT_REQUESTS.labels(endpoint="/ask").track_inprogress():
+        with collect_stage_timings() as timings:
+            with stage_timer("total"):
+                try:
+                    response = _answer(payload)
+                except UpstreamError as e:
+                    raise upstream_http_error(e)
+
+    if payload.include_timings:
+        response.timings = timings
+    return response
+
+
+@app.post("/search", response_model=SearchResponse)
+def search_passages(payload: SearchRequest) -> SearchResponse:
+    """
+    Retrieval only (no Gemini generation): passages + distances for a query.
+    - max_distance set → every passage within the threshold (range search)
+    - otherwise → the top_k closest passages
+    Results are paginated with offset / limit.
     """
-    global faiss_query
+    with INFLIGHT_REQUESTS.labels(endpoint="/search").track_inprogress():
+        with collect_stage_timings() as timings:
+            try:
+                response = _search(payload)
+            except UpstreamError as e:
+                raise upstream_http_error(e)
 
-    if faiss_query is None:
-        # Startup'ta FAISSQuery oluşturulamadıysa
+    if payload.include_timings:
+        response.timings = timings
+    return response
+
+
+def get_collection(collection_id: str | None) -> FAISSQuery:
+    """
+    Returns the collection's FAISSQuery, loading it on first use.
+    400 → invalid ID, 404 → unknown collection, 503 → index could not be loaded.
+    """
+    collection_id = collection_id or DEFAULT_COLLECTION
+    try:
+        return collection_store.get(collection_id)
+    except InvalidCollectionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CollectionNotFoundError as e:
+        if collection_id != DEFAULT_COLLECTION:
+            raise HTTPException(status_code=404, detail=f"Unknown collection '{collection_id}'.")
+        print(f"[ERROR] {e}")
         raise HTTPException(
             status_code=503,
             detail="FAISS index is not loaded yet. Please try again later.",
         )
+    except Exception as e:
+        print(f"[ERROR] Failed to load collection '{collection_id}': {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="FAISS index is not loaded yet. Please try again later.",
+        )
+
+
+def upstream_http_error(e: UpstreamError) -> HTTPException:
+    """
+    504 → Gemini did not answer within the deadline,
+    503 → Gemini failed / circuit breaker is open (with Retry-After).
+    """
+    print(f"[ERROR] Gemini call failed: {e!r} (cause: {e.__cause__!r})")
+    if isinstance(e, UpstreamTimeoutError):
+        return HTTPException(status_code=504, detail="The language model did not respond in time. Please try again.")
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(
+            status_code=503,
+            detail="The language model is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(max(int(e.retry_after + 0.999), 1))},
+        )
+    return HTTPException(status_code=503, detail="The language model request failed. Please try again.")
+
+
+def record_query(collection_id: str | None, question: str) -> None:
+    if QUERY_LOG_ENABLED:
+        query_log.record(collection_id or DEFAULT_COLLECTION, question)
+
+
+def _answer(payload: AskRequest) -> AskResponse:
+    faiss_query = get_collection(payload.collection)
+    record_query(payload.collection, payload.question)
 
     question = payload.question
     top_k = payload.top_k
 
     start_time = time.time()
 
-    # 1) Retrieve passages from FAISS
-    faiss_results: List[dict[str, Any]] = faiss_query.query(question, top_k=top_k)
+    rerank = RERANK_ENABLED and payload.rerank is not False
+
+    # 1) Retrieve passages from FAISS (more candidates when reranking)
+    candidates = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+    faiss_results: List[dict[str, Any]] = faiss_query.query(question, top_k=candidates)
+
+    # 1b) Rerank and keep only the best few for the prompt
+    #    (FAISS order is kept when the budget runs out or the model is not loaded)
+    if rerank:
+        reranker.start_loading()  # no-op once started
+        with stage_timer("rerank"):
+            faiss_results = reranker.rerank(question, faiss_results, top_n=min(top_k, reranker.top_n))
+
     passages_text = [r.get("text", "") for r in faiss_results]
 
     # 2) Generate answer using Gemini (through llm_wrapper)
@@ -137,21 +479,53 @@ def ask_question(payload: AskRequest) -> AskResponse:
     elapsed = time.time() - start_time
 
     # 3) Map raw FAISS dicts into Passage models
-    passages_out: List[Passage] = []
-    for r in faiss_results:
-        passages_out.append(
-            Passage(
-                text=r.get("text", ""),
-                source=r.get("source"),
-                page=r.get("page"),
-                title=r.get("title"),
-                distance=r.get("distance"),
-            )
-        )
+    passages_out = to_passages(faiss_results)
 
     return AskResponse(
         question=question,
+        collection=payload.collection or DEFAULT_COLLECTION,
         answer=answer,
         time=elapsed,
         passages=passages_out,
     )
+
+
+def _search(payload: SearchRequest) -> SearchResponse:
+    faiss_query = get_collection(payload.collection)
+    # Sonraki sayfalar aynı soru: sadece ilk sayfa sayılır (frekans şişmesin)
+    if payload.offset == 0:
+        record_query(payload.collection, payload.query)
+
+    start_time = time.time()
+
+    # Sayfalar aynı sorgu için tekrar istenir: embedding cache'ten gelir,
+    # FAISS araması ms altıdır, bu yüzden sonuç listesi her sayfada yeniden hesaplanır
+    if payload.max_distance is not None:
+        results = faiss_query.range_query(payload.query, payload.max_distance)
+    else:
+        results = faiss_query.query(payload.query, top_k=payload.top_k)
+
+    end = payload.offset + payload.limit
+    return SearchResponse(
+        query=payload.query,
+        collection=payload.collection or DEFAULT_COLLECTION,
+        passages=to_passages(results[payload.offset:end]),
+        total=len(results),
+        offset=payload.offset,
+        next_offset=end if end < len(results) else None,
+        time=time.time() - start_time,
+    )
+
+
+def to_passages(results: List[dict[str, Any]]) -> List[Passage]:
+    return [
+        Passage(
+            text=r.get("text", ""),
+            source=r.get("source"),
+            page=r.get("page"),
+            title=r.get("title"),
+            distance=r.get("distance"),
+            rerank_score=r.get("rerank_score"),
+        )
+        for r in results
+    ]
@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from .metrics import CACHE_ENTRIES, record_cache_lookup
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU cache.
+    Every lookup is reported to the rag_cache_* metrics under `name`.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024):
+        self.name = name
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+
+        record_cache_lookup(self.name, hit=value is not None)
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Like get(), but neither reported to metrics nor counted as a use."""
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            size = len(self._data)
+
+        CACHE_ENTRIES.labels(cache=self.name).set(size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+        CACHE_ENTRIES.labels(cache=self.name).set(0)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Set
+
+import numpy as np
+
+from .gemini_client import warm_embed_caller
+from .metrics import WARMED_QUERIES, stage_timer
+from .query_faiss import EMBED_BATCH_SIZE, FAISSQuery, embed_texts, embedding_cache, normalize_query
+from .query_log import QueryLog
+from .resilience import UpstreamError
+
+# ===============================
+# Cache warming (after startup / hot swap)
+# ===============================
+# Most frequent questions per collection to pre-compute
+WARM_TOP_N = int(os.getenv("WARM_TOP_N", "200"))
+# Passages cached per question (covers every /ask top_k up to this)
+WARM_TOP_K = int(os.getenv("WARM_TOP_K", "10"))
+# Wall-clock budget per collection; embedding stops when it runs out
+WARM_BUDGET_S = float(os.getenv("WARM_BUDGET_S", "30"))
+
+
+def warm_collection(
+    fq: FAISSQuery,
+    questions: List[str],
+    top_k: int = WARM_TOP_K,
+    budget_s: float = WARM_BUDGET_S,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+) -> dict:
+    """
+    Pre-computes query embeddings (one batched Gemini call per 100 questions,
+    most frequent first) and retrieval results for the given questions.
+    Questions not embedded within budget_s (or after Gemini fails) are skipped.
+    Embeds through warm_embed_caller, so warming never opens the live circuit.
+    """
+    embed_fn = embed_fn or (lambda texts: embed_texts(texts, caller=warm_embed_caller))
+    deadline = time.monotonic() + budget_s
+    questions = [normalize_query(q) for q in questions]
+
+    missing = [q for q in questions if embedding_cache.peek(q) is None]
+    embedded = 0
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        if time.monotonic() >= deadline:
+            break
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        try:
+            vectors = embed_fn(batch)
+        except UpstreamError as e:
+            print(f"[WARM] Embedding stopped after {embedded} questions: {e}")
+            break
+        for question, vector in zip(batch, vectors):
+            embedding_cache.put(question, vector.reshape(1, -1).astype(np.float32))
+        embedded += len(batch)
+
+    warmed = fq.warm(questions, top_k)
+    return {"questions": len(questions), "embedded": embedded, "warmed": warmed}
+
+
+class CacheWarmer:
+    """
+    Warms collections in one background thread, so warming never holds up
+    startup or the request that triggered it. A collection already waiting
+    to be warmed is not queued twice.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[str], FAISSQuery],
+        query_log: QueryLog,
+        top_n: int = WARM_TOP_N,
+        top_k: int = WARM_TOP_K,
+        budget_s: float = WARM_BUDGET_S,
+        embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    ):
+        self.get_collection = get_collection
+        self.query_log = query_log
+        self.top_n = top_n
+        self.top_k = top_k
+        self.budget_s = budget_s
+        self.embed_fn = embed_fn
+
+        self._pending: Set[str] = set()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-warm")
+
+    def schedule(self, collection_id: str):
+        """Queues warming of a collection; returns the future (None if already queued or shut down)."""
+        if self.top_n <= 0:
+            return None
+        with self._lock:
+            if self._closed or collection_id in self._pending:
+                return None
+            self._pending.add(collection_id)
+            return self._executor.submit(self._warm, collection_id)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _warm(self, collection_id: str) -> Optional[dict]:
+        with self._lock:
+            self._pending.discard(collection_id)
+
+        questions = self.query_log.top(collection_id, self.top_n)
+        if not questions:
+            return None
+
+        try:
+            with stage_timer("cache_warm"):
+                result = warm_collection(
+                    self.get_collection(collection_id), questions, self.top_k, self.budget_s, self.embed_fn
+                )
+        except Exception as e:
+            # Warming is best-effort: requests just pay the normal latency
+            print(f"[WARM] Warming '{collection_id}' failed: {e!r}")
+            return None
+
+        WARMED_QUERIES.labels(collection=collection_id).inc(result["warmed"])
+        print(
+            f"[WARM] '{collection_id}': {result['warmed']}/{result['questions']} frequent questions cached "
+            f"({result['embedded']} embedded)"
+        )
+        return result
@@ -0,0 +1,462 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .gcs_utils import (
+    download_file_from_gcs,
+    download_gcs_generation,
+    file_exists_in_gcs,
+    gcs_generation,
+    is_precondition_failed,
+    upload_file_to_gcs,
+)
+from .metrics import (
+    COLLECTION_EVICTIONS,
+    COLLECTION_MEMORY_BYTES,
+    INDEX_BYTES,
+    INDEX_VECTORS,
+    record_cache_lookup,
+)
+from .query_faiss import FAISSQuery, shard_manifest_path
+
+# ==========
+# GCS & FAISS paths
+# ==========
+BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "rag-documents-bucket-icu")
+
+# The default collection keeps the original single-course layout:
+#   gs://bucket/faiss/faiss_index.bin  →  data/faiss_index.bin
+# Every other collection (course) lives under its own prefix:
+#   gs://bucket/faiss/<collection>/faiss_index.bin
+DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "default")
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "data/faiss_index.bin")
+LOCAL_METADATA_PATH = os.getenv("LOCAL_METADATA_PATH", "data/faiss_metadata.json")
+LOCAL_CHUNKS_PATH = os.getenv("LOCAL_CHUNKS_PATH", "data/chunks.json")
+
+# Local copies of non-default collections (SKIP_GCS_DOWNLOAD=1 reads from here)
+LOCAL_COLLECTIONS_DIR = os.getenv("LOCAL_COLLECTIONS_DIR", "data/collections")
+
+# "1" → GCS'e hiç gitme, local dosyaları kullan (local dev / load test)
+SKIP_GCS_DOWNLOAD = os.getenv("SKIP_GCS_DOWNLOAD", "0") == "1"
+
+# Memory budget for loaded collections; pinned collections are never evicted
+COLLECTION_CACHE_MB = float(os.getenv("COLLECTION_CACHE_MB", "1024"))
+PINNED_COLLECTIONS = [
+    c.strip() for c in os.getenv("PINNED_COLLECTIONS", DEFAULT_COLLECTION).split(",") if c.strip()
+]
+
+# Loaded collections are compared with GCS this often; a version published
+# elsewhere (another instance's ingestion, src/embed_faiss.py) is reloaded
+COLLECTION_REFRESH_S = float(os.getenv("COLLECTION_REFRESH_S", "60"))
+# A publish uploads the index, then the metadata: a download in between sees
+# mismatched files and is retried
+LOAD_ATTEMPTS = 3
+
+# Unknown collection IDs are remembered for this long (no GCS lookup per request)
+COLLECTION_MISSING_TTL_S = float(os.getenv("COLLECTION_MISSING_TTL_S", "30"))
+MAX_MISSING_COLLECTIONS = 1024
+
+COLLECTION_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+class InvalidCollectionError(ValueError):
+    """Collection ID is not a safe path component."""
+
+
+class CollectionNotFoundError(LookupError):
+    """No index exists for the collection."""
+
+
+class CollectionConflictError(RuntimeError):
+    """The collection was published elsewhere since the version being updated was loaded."""
+
+
+def gcs_prefix(collection_id: str) -> str:
+    if collection_id == DEFAULT_COLLECTION:
+        return "faiss"
+    return f"faiss/{collection_id}"
+
+
+def local_paths(collection_id: str) -> Dict[str, str]:
+    if collection_id == DEFAULT_COLLECTION:
+        return {
+            "index": LOCAL_INDEX_PATH,
+            "metadata": LOCAL_METADATA_PATH,
+            "chunks": LOCAL_CHUNKS_PATH,
+        }
+    base = os.path.join(LOCAL_COLLECTIONS_DIR, collection_id)
+    return {
+        "index": os.path.join(base, "faiss_index.bin"),
+        "metadata": os.path.join(base, "faiss_metadata.json"),
+        "chunks": os.path.join(base, "chunks.json"),
+    }
+
+
+def download_faiss_assets(collection_id: str, paths: Dict[str, str]) -> Dict[str, Optional[int]]:
+    """
+    GCS'den FAISS index + metadata (+ chunks) dosyalarını local path'lere indirir.
+    İndirilen GCS generation'larını döner (shard'lı index için "index": None).
+    """
+    prefix = gcs_prefix(collection_id)
+    print(f"[COLLECTIONS] Downloading '{collection_id}' from gs://{BUCKET_NAME}/{prefix}/ ...")
+
+    gcs_index = f"{prefix}/faiss_index.bin"
+    gcs_manifest = f"{prefix}/faiss_index.shards.json"
+    index_generation: Optional[int] = download_gcs_generation(gcs_index, paths["index"], BUCKET_NAME)
+    if not index_generation:
+        if not file_exists_in_gcs(gcs_manifest, BUCKET_NAME):
+            raise CollectionNotFoundError(f"FAISS index not found in GCS: gs://{BUCKET_NAME}/{gcs_index}")
+        # A stale single-file index would take precedence over the shards
+        if os.path.exists(paths["index"]):
+            os.remove(paths["index"])
+        download_index_shards(prefix, shard_manifest_path(paths["index"]))
+        index_generation = None
+
+    gcs_metadata = f"{prefix}/faiss_metadata.json"
+    metadata_generation = download_gcs_generation(gcs_metadata, paths["metadata"], BUCKET_NAME)
+    if not metadata_generation:
+        raise CollectionNotFoundError(f"Metadata not found in GCS: gs://{BUCKET_NAME}/{gcs_metadata}")
+
+    if "chunks" in paths:
+        gcs_chunks = f"{prefix}/chunks.json"
+        if file_exists_in_gcs(gcs_chunks, BUCKET_NAME):
+            download_file_from_gcs(gcs_chunks, paths["chunks"], BUCKET_NAME)
+        else:
+            print(f"[WARN] Chunks not found in GCS: gs://{BUCKET_NAME}/{gcs_chunks}")
+
+    return {"index": index_generation, "metadata": metadata_generation}
+
+
+def download_index_shards(prefix: str, local_manifest: str) -> None:
+    """Downloads a shard manifest and every shard it lists (built with src/shard_index.py)."""
+    download_file_from_gcs(f"{prefix}/faiss_index.shards.json", local_manifest, BUCKET_NAME)
+    with open(local_manifest, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(local_manifest)
+    for shard in manifest["shards"]:
+        download_file_from_gcs(f"{prefix}/{shard['path']}", os.path.join(base_dir, shard["path"]), BUCKET_NAME)
+
+
+def load_collection(collection_id: str) -> FAISSQuery:
+    """
+    Loads one collection's index + metadata.
+    - SKIP_GCS_DOWNLOAD=1: read the local files
+    - default collection: download to data/ (original layout, files are kept)
+    - other collections: download to a temp dir that is removed once loaded,
+      so evicted courses do not keep using (in-memory) disk on Cloud Run
+    """
+    paths = local_paths(collection_id)
+
+    if SKIP_GCS_DOWNLOAD:
+        if not os.path.exists(paths["index"]) and not os.path.exists(shard_manifest_path(paths["index"])):
+            raise CollectionNotFoundError(f"FAISS index not found: {paths['index']}")
+        return FAISSQuery(index_path=paths["index"], metadata_path=paths["metadata"])
+
+    if collection_id == DEFAULT_COLLECTION:
+        return load_from_gcs(collection_id, paths)
+
+    tmp_dir = tempfile.mkdtemp(prefix=f"rag-{collection_id}-")
+    try:
+        tmp_paths = {
+            "index": os.path.join(tmp_dir, "faiss_index.bin"),
+            "metadata": os.path.join(tmp_dir, "faiss_metadata.json"),
+        }
+        return load_from_gcs(collection_id, tmp_paths)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_from_gcs(collection_id: str, paths: Dict[str, str]) -> FAISSQuery:
+    """
+    Downloads and loads one consistent version: retried when a file changed
+    during the download or the index and metadata do not match (a publish
+    is between its two uploads).
+    """
+    for attempt in range(1, LOAD_ATTEMPTS + 1):
+        try:
+            generations = download_faiss_assets(collection_id, paths)
+        except Exception as e:
+            if not is_precondition_failed(e) or attempt == LOAD_ATTEMPTS:
+                raise
+            continue
+
+        fq = FAISSQuery(index_path=paths["index"], metadata_path=paths["metadata"])
+        if fq.index.ntotal == len(fq.metadata):
+            fq.gcs_generations = generations
+            return fq
+        if attempt < LOAD_ATTEMPTS:
+            time.sleep(attempt)
+
+    raise RuntimeError(
+        f"Collection '{collection_id}': index ({fq.index.ntotal}) and metadata ({len(fq.metadata)}) "
+        f"do not match; a publish may be in progress."
+    )
+
+
+def collection_changed_in_gcs(collection_id: str, fq: FAISSQuery) -> bool:
+    """True when a newer version was published (the metadata is uploaded last)."""
+    generations = getattr(fq, "gcs_generations", None)
+    if not generations:
+        return False
+    current = gcs_generation(f"{gcs_prefix(collection_id)}/faiss_metadata.json", BUCKET_NAME)
+    return current not in (0, generations["metadata"])
+
+
+def save_collection(
+    collection_id: str,
+    index,
+    metadata: List[dict],
+    generations: Optional[Dict[str, Optional[int]]] = None,
+) -> FAISSQuery:
+    """
+    Persists a new version of a collection and returns it loaded:
+    - SKIP_GCS_DOWNLOAD=1: written to the collection's local paths only
+    - otherwise uploaded to gs://bucket/<prefix>/ (default collection also
+      keeps its local copy in data/, like load_collection)
+    generations: GCS generations of the version this one extends
+    (FAISSQuery.gcs_generations; 0 = the collection must not exist yet).
+    Uploads only succeed if GCS still holds that version, otherwise
+    CollectionConflictError (another instance published in between).
+    """
+    import faiss
+
+    tmp_dir = tempfile.mkdtemp(prefix=f"rag-{collection_id}-")
+    try:
+        tmp_paths = {
+            "index": os.path.join(tmp_dir, "faiss_index.bin"),
+            "metadata": os.path.join(tmp_dir, "faiss_metadata.json"),
+        }
+        faiss.write_index(index, tmp_paths["index"])
+        with open(tmp_paths["metadata"], "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+
+        published = None
+        if not SKIP_GCS_DOWNLOAD:
+            published = publish_to_gcs(collection_id, tmp_paths, generations or {})
+
+        # Local copy is only replaced once the publish succeeded
+        paths = tmp_paths
+        if SKIP_GCS_DOWNLOAD or collection_id == DEFAULT_COLLECTION:
+            paths = local_paths(collection_id)
+            os.makedirs(os.path.dirname(paths["index"]) or ".", exist_ok=True)
+            shutil.move(tmp_paths["index"], paths["index"])
+            shutil.move(tmp_paths["metadata"], paths["metadata"])
+
+        fq = FAISSQuery(index_path=paths["index"], metadata_path=paths["metadata"])
+        fq.gcs_generations = published
+        return fq
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def publish_to_gcs(
+    collection_id: str, paths: Dict[str, str], generations: Dict[str, Optional[int]]
+) -> Dict[str, Optional[int]]:
+    """Uploads index, then metadata (readers treat the metadata as the commit), each with its precondition."""
+    prefix = gcs_prefix(collection_id)
+    published: Dict[str, Optional[int]] = {}
+    for name, gcs_name in (("index", "faiss_index.bin"), ("metadata", "faiss_metadata.json")):
+        try:
+            published[name] = upload_file_to_gcs(
+                paths[name], f"{prefix}/{gcs_name}", BUCKET_NAME, if_generation_match=generations.get(name)
+            )
+        except Exception as e:
+            if is_precondition_failed(e):
+                raise CollectionConflictError(
+                    f"Collection '{collection_id}' was published elsewhere while this update was prepared."
+                ) from e
+            raise
+    return published
+
+
+class CollectionStore:
+    """
+    Loaded collections, kept in LRU order under a memory budget.
+
+    - get() loads a collection on first use (one loader per collection at a
+      time; requests for other collections are not blocked). Collections
+      that do not exist are remembered for missing_ttl_s.
+    - When the budget is exceeded, least recently used collections are
+      evicted. Pinned collections are never evicted, and the collection that
+      was just loaded stays even if it alone exceeds the budget.
+    - refresh() (or the refresher thread) reloads collections for which
+      is_stale() reports a newer published version.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], FAISSQuery] = load_collection,
+        max_bytes: float = COLLECTION_CACHE_MB * 1024 * 1024,
+        pinned: Iterable[str] = PINNED_COLLECTIONS,
+        missing_ttl_s: float = COLLECTION_MISSING_TTL_S,
+        is_stale: Callable[[str, FAISSQuery], bool] = collection_changed_in_gcs,
+    ):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self.missing_ttl_s = missing_ttl_s
+        self.is_stale = is_stale
+
+        self._loaded: "OrderedDict[str, FAISSQuery]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # collection_id → [lock, requests using it]; removed when the last one is done
+        self._load_locks: Dict[str, list] = {}
+        # collection_id → (expires_at, message), oldest first
+        self._missing: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._stop = threading.Event()
+
+    @staticmethod
+    def validate(collection_id: str) -> str:
+        if not COLLECTION_ID_RE.match(collection_id or ""):
+            raise InvalidCollectionError(
+                f"Invalid collection id {collection_id!r}: use letters, digits, '-' or '_' (max 64)."
+            )
+        return collection_id
+
+    def get(self, collection_id: str) -> FAISSQuery:
+        self.validate(collection_id)
+
+        with self._lock:
+            fq = self._loaded.get(collection_id)
+            if fq is not None:
+                self._loaded.move_to_end(collection_id)
+            else:
+                self._raise_if_missing(collection_id)
+                entry = self._load_locks.setdefault(collection_id, [threading.Lock(), 0])
+                entry[1] += 1
+
+        record_cache_lookup("collection", hit=fq is not None)
+        if fq is not None:
+            return fq
+
+        try:
+            with entry[0]:
+                # Another request may have loaded it (or found it missing) while we waited
+                with self._lock:
+                    fq = self._loaded.get(collection_id)
+                    if fq is None:
+                        self._raise_if_missing(collection_id)
+                if fq is None:
+                    try:
+                        fq = self.loader(collection_id)
+                    except CollectionNotFoundError as e:
+                        self._remember_missing(collection_id, str(e))
+                        raise
+                    self.put(collection_id, fq)
+                return fq
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._load_locks[collection_id]
+
+    def put(self, collection_id: str, fq: FAISSQuery, replace: Optional[FAISSQuery] = None) -> bool:
+        """
+        Adds (or hot-swaps) a loaded collection and enforces the memory budget.
+        replace: only swap if this is still the loaded version (else False).
+        """
+        with self._lock:
+            if replace is not None and self._loaded.get(collection_id) is not replace:
+                return False
+            self._missing.pop(collection_id, None)
+            self._loaded[collection_id] = fq
+            self._loaded.move_to_end(collection_id)
+            self._sizes[collection_id] = fq.memory_bytes
+            evicted = self._evict(keep=collection_id)
+            total = sum(self._sizes.values())
+
+        INDEX_VECTORS.labels(collection=collection_id).set(fq.index.ntotal)
+        INDEX_BYTES.labels(collection=collection_id).set(fq.memory_bytes)
+        for cid in evicted:
+            COLLECTION_EVICTIONS.inc()
+            INDEX_VECTORS.remove(cid)
+            INDEX_BYTES.remove(cid)
+            print(f"[COLLECTIONS] Evicted '{cid}' (LRU, memory budget {self.max_bytes / 1e6:.0f} MB)")
+        COLLECTION_MEMORY_BYTES.set(total)
+        return True
+
+    def refresh(self) -> List[str]:
+        """Reloads loaded collections that were published elsewhere; returns the swapped IDs."""
+        with self._lock:
+            loaded = list(self._loaded.items())
+
+        refreshed = []
+        for cid, fq in loaded:
+            try:
+                if not self.is_stale(cid, fq):
+                    continue
+                # A local publish (ingestion) in the meantime wins: put() skips the swap
+                if self.put(cid, self.loader(cid), replace=fq):
+                    refreshed.append(cid)
+                    print(f"[COLLECTIONS] Reloaded '{cid}' (newer version published)")
+            except Exception as e:
+                print(f"[COLLECTIONS] Refresh of '{cid}' failed, keeping the loaded version: {e!r}")
+        return refreshed
+
+    def start_refresher(
+        self, interval_s: float = COLLECTION_REFRESH_S, on_refreshed: Optional[Callable[[str], object]] = None
+    ) -> threading.Thread:
+        """Runs refresh() every interval_s in a daemon thread until stop()."""
+
+        def loop() -> None:
+            while not self._stop.wait(interval_s):
+                for cid in self.refresh():
+                    if on_refreshed is not None:
+                        on_refreshed(cid)
+
+        thread = threading.Thread(target=loop, name="collection-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _raise_if_missing(self, collection_id: str) -> None:
+        """Raises the remembered CollectionNotFoundError (caller holds self._lock)."""
+        missing = self._missing.get(collection_id)
+        if missing is not None:
+            if missing[0] > time.monotonic():
+                raise CollectionNotFoundError(missing[1])
+            del self._missing[collection_id]
+
+    def _remember_missing(self, collection_id: str, message: str) -> None:
+        if self.missing_ttl_s <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._missing.pop(collection_id, None)
+            self._missing[collection_id] = (now + self.missing_ttl_s, message)
+            # Same TTL for all: expired entries are at the front
+            while self._missing and (
+                next(iter(self._missing.values()))[0] <= now or len(self._missing) > MAX_MISSING_COLLECTIONS
+            ):
+                self._missing.popitem(last=False)
+
+    def _evict(self, keep: str) -> List[str]:
+        evicted = []
+        for cid in list(self._loaded):
+            if sum(self._sizes.values()) <= self.max_bytes:
+                break
+            if cid == keep or cid in self.pinned:
+                continue
+            del self._loaded[cid]
+            del self._sizes[cid]
+            evicted.append(cid)
+        return evicted
+
+    def loaded(self) -> Dict[str, int]:
+        """{collection_id: approx. bytes} in LRU order (oldest first)."""
+        with self._lock:
+            return {cid: self._sizes[cid] for cid in self._loaded}
+
+    def __contains__(self, collection_id: str) -> bool:
+        return collection_id in self._loaded
@@ -1,23 +1,34 @@
 import os
-from google.cloud import storage
 
 # Get from env or use default bucket
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "rag-documents-bucket-icu")
 
 def get_storage_client():
+    # Imported lazily: google.cloud.storage is slow to import and only needed when talking to GCS
+    from google.cloud import storage
+
     return storage.Client()
 
-def upload_file_to_gcs(local_path: str, gcs_path: str, bucket_name: str | None = None):
+def upload_file_to_gcs(
+    local_path: str,
+    gcs_path: str,
+    bucket_name: str | None = None,
+    if_generation_match: int | None = None,
+) -> int:
     """
-    local_path -> GCS (bucket/gcs_path)
+    local_path -> GCS (bucket/gcs_path); returns the new generation.
+    if_generation_match: only overwrite this generation of the object
+    (0 → only if it does not exist); otherwise GCS rejects the upload
+    (see is_precondition_failed).
     """
     bucket_name = bucket_name or GCS_BUCKET_NAME
     client = get_storage_client()
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(gcs_path)
 
-    blob.upload_from_filename(local_path)
+    blob.upload_from_filename(local_path, if_generation_match=if_generation_match)
     print(f"[GCS] Uploaded {local_path} -> gs://{bucket_name}/{gcs_path}")
+    return blob.generation
 
 def download_file_from_gcs(gcs_path: str, local_path: str, bucket_name: str | None = None):
     """
@@ -32,9 +43,47 @@ def download_file_from_gcs(gcs_path: str, local_path: str, bucket_name: str | No
     blob.download_to_filename(local_path)
     print(f"[GCS] Downloaded gs://{bucket_name}/{gcs_path} -> {local_path}")
 
+def download_gcs_generation(gcs_path: str, local_path: str, bucket_name: str | None = None) -> int:
+    """
+    GCS -> local_path, pinned to one generation of the object.
+    Returns that generation (0 if the object does not exist, nothing is
+    downloaded), for a read-modify-write with upload_file_to_gcs(if_generation_match=...).
+    """
+    bucket_name = bucket_name or GCS_BUCKET_NAME
+    client = get_storage_client()
+    blob = client.bucket(bucket_name).get_blob(gcs_path)
+    if blob is None:
+        return 0
+
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    blob.download_to_filename(local_path, if_generation_match=blob.generation)
+    return blob.generation
+
+def gcs_generation(gcs_path: str, bucket_name: str | None = None) -> int:
+    """Current generation of bucket/gcs_path (0 if it does not exist); metadata request only."""
+    bucket_name = bucket_name or GCS_BUCKET_NAME
+    client = get_storage_client()
+    blob = client.bucket(bucket_name).get_blob(gcs_path)
+    return blob.generation if blob is not None else 0
+
+def is_precondition_failed(error: BaseException) -> bool:
+    """True for GCS 412 errors (the object changed since its generation was read)."""
+    return getattr(error, "code", None) == 412
+
 def file_exists_in_gcs(gcs_path: str, bucket_name: str | None = None) -> bool:
     bucket_name = bucket_name or GCS_BUCKET_NAME
     client = get_storage_client()
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(gcs_path)
     return blob.exists()
+
+def delete_file_from_gcs(gcs_path: str, bucket_name: str | None = None) -> None:
+    """
+    Deletes bucket/gcs_path if it exists.
+    """
+    bucket_name = bucket_name or GCS_BUCKET_NAME
+    client = get_storage_client()
+    blob = client.bucket(bucket_name).blob(gcs_path)
+    if blob.exists():
+        blob.delete()
+        print(f"[GCS] Deleted gs://{bucket_name}/{gcs_path}")
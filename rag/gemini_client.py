@@ -0,0 +1,152 @@
+import os
+import threading
+from typing import Optional
+
+from .resilience import CircuitBreaker, ResilientCaller
+
+# google.generativeai is imported on first use (not at module import):
+# it is slow to import and needs GEMINI_API_KEY, which offline tools and
+# tests do not have.
+
+# Optional override of the Gemini API host, e.g. "http://127.0.0.1:8001" to
+# point the app at the local stand-in used by tests/performance/load_test.py.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# ===============================
+# Tail-latency controls (see rag/resilience.py)
+# ===============================
+# Per-attempt timeout / overall deadline (retries included), seconds
+GEMINI_EMBED_TIMEOUT_S = float(os.getenv("GEMINI_EMBED_TIMEOUT_S", "5"))
+GEMINI_EMBED_DEADLINE_S = float(os.getenv("GEMINI_EMBED_DEADLINE_S", "10"))
+GEMINI_GENERATE_TIMEOUT_S = float(os.getenv("GEMINI_GENERATE_TIMEOUT_S", "30"))
+GEMINI_GENERATE_DEADLINE_S = float(os.getenv("GEMINI_GENERATE_DEADLINE_S", "45"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+# Send a second (hedged) request if the first has not answered after this
+# many seconds; 0 disables. Embeddings are cheap, so they are hedged by
+# default; generation is not (it would double token cost).
+GEMINI_EMBED_HEDGE_S = float(os.getenv("GEMINI_EMBED_HEDGE_S", "1.0"))
+GEMINI_GENERATE_HEDGE_S = float(os.getenv("GEMINI_GENERATE_HEDGE_S", "0"))
+# Consecutive failures before failing fast, and how long to stay open
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET_S = float(os.getenv("GEMINI_BREAKER_RESET_S", "30"))
+
+embed_caller = ResilientCaller(
+    "embed",
+    timeout_s=GEMINI_EMBED_TIMEOUT_S,
+    deadline_s=GEMINI_EMBED_DEADLINE_S,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    hedge_after_s=GEMINI_EMBED_HEDGE_S,
+    breaker=CircuitBreaker("embed", GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_S),
+)
+generate_caller = ResilientCaller(
+    "generate",
+    timeout_s=GEMINI_GENERATE_TIMEOUT_S,
+    deadline_s=GEMINI_GENERATE_DEADLINE_S,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    hedge_after_s=GEMINI_GENERATE_HEDGE_S,
+    breaker=CircuitBreaker("generate", GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_S),
+)
+# Background ingestion embeds in bulk: its own breaker and threads, so its
+# 429s / 5xx never open the circuit that live /ask embeddings go through
+ingest_embed_caller = ResilientCaller(
+    "ingest_embed",
+    timeout_s=GEMINI_EMBED_TIMEOUT_S,
+    deadline_s=GEMINI_EMBED_DEADLINE_S,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    breaker=CircuitBreaker("ingest_embed", GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_S),
+    max_workers=4,
+)
+# Cache warming (rag/cache_warming.py) is background bulk work too
+warm_embed_caller = ResilientCaller(
+    "warm_embed",
+    timeout_s=GEMINI_EMBED_TIMEOUT_S,
+    deadline_s=GEMINI_EMBED_DEADLINE_S,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    breaker=CircuitBreaker("warm_embed", GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_S),
+    max_workers=2,
+)
+
+_lock = threading.RLock()
+_configured = False
+_models = {}
+
+
+def configure_gemini(api_key: str) -> None:
+    """
+    Configures the google-generativeai SDK.
+    When GEMINI_API_ENDPOINT is set, requests go over REST to that host
+    instead of the public Gemini API.
+    """
+    import google.generativeai as genai
+
+    if GEMINI_API_ENDPOINT:
+        genai.configure(
+            api_key=api_key,
+            transport="rest",
+            client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+        )
+    else:
+        genai.configure(api_key=api_key)
+
+
+def get_genai():
+    """
+    Returns the google.generativeai module, configured on first call.
+    Raises RuntimeError if GEMINI_API_KEY is missing.
+    """
+    global _configured
+
+    with _lock:
+        if not _configured:
+            # Load .env file if exists (local dev)
+            from dotenv import load_dotenv
+
+            load_dotenv()
+
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise RuntimeError(
+                    "ERROR: GEMINI_API_KEY is not set. Add it to your Cloud Run env vars."
+                )
+            configure_gemini(api_key)
+            _configured = True
+
+    import google.generativeai as genai
+
+    return genai
+
+
+def get_model(model_name: str):
+    """Returns a cached GenerativeModel (created on first use)."""
+    with _lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = get_genai().GenerativeModel(model_name)
+            _models[model_name] = model
+        return model
+
+
+def _request_options(timeout: float) -> dict:
+    # retry=None: the SDK's own retry (up to 600 s on 503) would hide
+    # behind our deadline; ResilientCaller does the retrying instead.
+    return {"timeout": timeout, "retry": None}
+
+
+def embed_content(hedge: bool = True, caller: Optional[ResilientCaller] = None, **kwargs):
+    """
+    genai.embed_content(**kwargs) with timeout, retries, hedging and circuit breaker
+    (through embed_caller unless another caller is given).
+    """
+    return (caller or embed_caller).call(
+        lambda timeout: get_genai().embed_content(request_options=_request_options(timeout), **kwargs),
+        hedge=hedge,
+    )
+
+
+def generate_content(model_name: str, prompt, **kwargs):
+    """GenerativeModel.generate_content(prompt, **kwargs) with the same controls as embed_content."""
+    return generate_caller.call(
+        lambda timeout: get_model(model_name).generate_content(
+            prompt, request_options=_request_options(timeout), **kwargs
+        )
+    )
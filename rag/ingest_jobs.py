@@ -0,0 +1,321 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .collection_store import (
+    CollectionConflictError,
+    CollectionNotFoundError,
+    CollectionStore,
+    save_collection,
+)
+from .gemini_client import ingest_embed_caller
+from .metrics import INGEST_JOBS, stage_timer
+from .query_faiss import embed_texts
+
+# ===============================
+# Limits
+# ===============================
+# Jobs running at the same time (each uses one thread + one parser process)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# Jobs waiting for a worker; further uploads get 429
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "8"))
+# Upload size limit per request
+INGEST_MAX_UPLOAD_MB = float(os.getenv("INGEST_MAX_UPLOAD_MB", "50"))
+# Texts per batchEmbedContents call + pause between calls, so ingestion
+# leaves Gemini quota for live /ask traffic
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "50"))
+INGEST_EMBED_PAUSE_S = float(os.getenv("INGEST_EMBED_PAUSE_S", "0.2"))
+# Finished jobs kept for status queries
+INGEST_JOB_HISTORY = 100
+# Publishes retried when another instance published the collection first
+# (each retry reloads the collection and appends again)
+INGEST_PUBLISH_ATTEMPTS = 3
+# Key required (X-API-Key header) by the upload / job endpoints; unset → endpoints disabled
+INGEST_API_KEY = os.getenv("INGEST_API_KEY", "")
+
+ALLOWED_EXTENSIONS = (".pdf", ".txt")
+
+
+class IngestQueueFullError(RuntimeError):
+    """Too many ingestion jobs are queued."""
+
+
+@dataclass
+class IngestJob:
+    id: str
+    collection: str
+    files: List[str]
+    status: str = "queued"          # queued → running → succeeded / failed
+    stage: str = "queued"           # parsing → embedding → indexing → publishing → done
+    progress: float = 0.0           # 0..1 within the current stage
+    chunks_added: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def parse_file(path: str, chunk_size: int = 350) -> List[dict]:
+    """Runs in a worker process: PDF/TXT → chunks (CPU-bound, kept off the API process)."""
+    from src.ingest import ingest_all
+
+    return ingest_all([path], file_type="both", chunk_size=chunk_size)
+
+
+class IngestJobManager:
+    """
+    Background ingestion: parse → embed → add to the collection index →
+    publish (GCS) → hot-swap in the CollectionStore.
+
+    Jobs run on their own small thread pool, and PDF parsing runs in a
+    separate process pool, so uploads do not compete with /ask for the
+    API's request threads or the GIL. Jobs touching the same collection
+    run one at a time so index updates are not lost.
+    """
+
+    def __init__(
+        self,
+        store: CollectionStore,
+        workers: int = INGEST_WORKERS,
+        max_queued: int = INGEST_MAX_QUEUED,
+        embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+        parse_fn: Callable[[str], List[dict]] = parse_file,
+        save_fn: Callable = save_collection,
+        on_published: Optional[Callable[[str], None]] = None,
+        use_processes: bool = True,
+    ):
+        self.store = store
+        self.max_queued = max_queued
+        # Own Gemini caller / circuit breaker: ingestion errors must not fail /ask
+        self.embed_fn = embed_fn or (
+            lambda texts: embed_texts(texts, task_type="retrieval_document", caller=ingest_embed_caller)
+        )
+        self.parse_fn = parse_fn
+        self.save_fn = save_fn
+        self.on_published = on_published
+
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        # collection_id → [lock, jobs using it]; removed when the last one is done
+        self._collection_locks: Dict[str, list] = {}
+
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._processes = (
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            if use_processes else None
+        )
+
+    # --------------------------
+    # Public API
+    # --------------------------
+    def submit(self, collection_id: str, uploaded: Dict[str, bytes]) -> IngestJob:
+        """
+        Queues a job for {filename: content}. Files are written to a temp dir
+        owned by the job. Raises IngestQueueFullError when the queue is full.
+        """
+        self.store.validate(collection_id)
+
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if queued >= self.max_queued:
+                raise IngestQueueFullError(f"{queued} ingestion jobs already queued; try again later.")
+
+            job = IngestJob(id=uuid.uuid4().hex, collection=collection_id, files=sorted(uploaded))
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._update_gauges()
+
+        work_dir = tempfile.mkdtemp(prefix=f"ingest-{job.id}-")
+        paths = []
+        for name, content in uploaded.items():
+            path = os.path.join(work_dir, name)
+            with open(path, "wb") as f:
+                f.write(content)
+            paths.append(path)
+
+        self._threads.submit(self._run, job, paths, work_dir)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def shutdown(self) -> None:
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+    # --------------------------
+    # Job pipeline
+    # --------------------------
+    def _run(self, job: IngestJob, paths: List[str], work_dir: str) -> None:
+        collection_lock = self._acquire_collection_lock(job.collection)
+        try:
+            with collection_lock[0]:
+                self._set(job, status="running", started_at=time.time())
+                chunks = self._parse(job, paths)
+                vectors = self._embed(job, chunks)
+                fq = self._index_and_publish(job, chunks, vectors)
+
+                # Swap inside the lock: the next job on this collection must copy this index
+                self.store.put(job.collection, fq)
+                if self.on_published is not None:
+                    self.on_published(job.collection)
+
+            self._set(job, status="succeeded", stage="done", progress=1.0, chunks_added=len(chunks))
+        except Exception as e:
+            print(f"[INGEST] Job {job.id} failed: {e!r}")
+            self._set(job, status="failed", error=str(e))
+        finally:
+            self._release_collection_lock(job.collection, collection_lock)
+            self._set(job, finished_at=time.time())
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _parse(self, job: IngestJob, paths: List[str]) -> List[dict]:
+        self._set(job, stage="parsing", progress=0.0)
+        chunks: List[dict] = []
+
+        with stage_timer("ingest_parse"):
+            if self._processes is None:
+                for i, path in enumerate(paths):
+                    chunks.extend(self.parse_fn(path))
+                    self._set(job, progress=(i + 1) / len(paths))
+            else:
+                futures = {self._processes.submit(self.parse_fn, p): p for p in paths}
+                by_path = {}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    by_path[futures[future]] = future.result()
+                    self._set(job, progress=done / len(paths))
+                for path in paths:
+                    chunks.extend(by_path[path])
+
+        chunks = [c for c in chunks if c["text"].strip()]
+        if not chunks:
+            raise ValueError("No text could be extracted from the uploaded files.")
+        return chunks
+
+    def _embed(self, job: IngestJob, chunks: List[dict]) -> np.ndarray:
+        self._set(job, stage="embedding", progress=0.0)
+        texts = [c["text"] for c in chunks]
+        batches = []
+
+        with stage_timer("ingest_embed"):
+            for start in range(0, len(texts), INGEST_EMBED_BATCH):
+                batches.append(self.embed_fn(texts[start:start + INGEST_EMBED_BATCH]))
+                self._set(job, progress=min(start + INGEST_EMBED_BATCH, len(texts)) / len(texts))
+                if start + INGEST_EMBED_BATCH < len(texts):
+                    time.sleep(INGEST_EMBED_PAUSE_S)
+
+        return np.vstack(batches).astype(np.float32)
+
+    def _index_and_publish(self, job: IngestJob, chunks: List[dict], vectors: np.ndarray):
+        new_metadata = [
+            {
+                "id": c["id"],
+                "text": c["text"],
+                "source": c["source"],
+                "page": c["page"],
+                "title": c.get("title", "Unknown"),
+            }
+            for c in chunks
+        ]
+
+        for attempt in range(1, INGEST_PUBLISH_ATTEMPTS + 1):
+            # Retries start from the version the other publisher uploaded
+            current = self._current_version(job.collection, reload=attempt > 1)
+            index, metadata = self._append(job, current, vectors, new_metadata)
+
+            self._set(job, stage="publishing", progress=0.0)
+            # Precondition: GCS must still hold the version we appended to (0 → must not exist yet)
+            generations = getattr(current, "gcs_generations", None) if current is not None else {
+                "index": 0, "metadata": 0,
+            }
+            try:
+                with stage_timer("ingest_publish"):
+                    return self.save_fn(job.collection, index, metadata, generations=generations)
+            except CollectionConflictError as e:
+                if attempt == INGEST_PUBLISH_ATTEMPTS:
+                    raise
+                print(f"[INGEST] Job {job.id}: {e} Retrying on the new version.")
+
+    def _current_version(self, collection_id: str, reload: bool):
+        try:
+            return self.store.loader(collection_id) if reload else self.store.get(collection_id)
+        except CollectionNotFoundError:
+            return None
+
+    def _append(self, job: IngestJob, current, vectors: np.ndarray, new_metadata: List[dict]):
+        import faiss
+
+        self._set(job, stage="indexing", progress=0.0)
+        with stage_timer("ingest_index"):
+            if current is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+                metadata = []
+            else:
+                if isinstance(current.index, faiss.IndexShards):
+                    raise ValueError(
+                        "Collection is served as shards; rebuild it with src/shard_index.py to add documents."
+                    )
+                # Copy: the live index keeps serving /ask until the swap
+                index = faiss.clone_index(current.index)
+                metadata = list(current.metadata)
+
+            if index.d != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {index.d}.")
+
+            index.add(vectors)
+            metadata.extend(new_metadata)
+        return index, metadata
+
+    # --------------------------
+    # Helpers
+    # --------------------------
+    def _acquire_collection_lock(self, collection_id: str) -> list:
+        with self._lock:
+            entry = self._collection_locks.setdefault(collection_id, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry
+
+    def _release_collection_lock(self, collection_id: str, entry: list) -> None:
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._collection_locks[collection_id]
+
+    def _set(self, job: IngestJob, **changes) -> None:
+        with self._lock:
+            for key, value in changes.items():
+                setattr(job, key, value)
+        if "status" in changes:
+            self._update_gauges()
+
+    def _trim_history(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("succeeded", "failed")]
+        for jid in finished[:max(len(self._jobs) - INGEST_JOB_HISTORY, 0)]:
+            del self._jobs[jid]
+
+    def _update_gauges(self) -> None:
+        with self._lock:
+            counts = {s: 0 for s in ("queued", "running", "succeeded", "failed")}
+            for j in self._jobs.values():
+                counts[j.status] += 1
+        for status, n in counts.items():
+            INGEST_JOBS.labels(status=status).set(n)
@@ -1,25 +1,12 @@
 # rag/llm_wrapper.py
 from typing import List
 import os
-from dotenv import load_dotenv
-import google.generativeai as genai
 
-# Load .env file if exists (local dev)
-load_dotenv()
+from .gemini_client import generate_content
+from .metrics import stage_timer
 
-# Load API Key
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError(
-        "ERROR: GEMINI_API_KEY is not set. Add it to your Cloud Run env vars."
-    )
-
-# Configure Gemini client
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Choose model (default to gemini-2.5-flash)
+# Choose model (default to gemini-2.5-flash); the client + model are created on first use
 MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
-model = genai.GenerativeModel(MODEL_NAME)
 
 
 def build_prompt(question: str, passages: List[str]) -> str:
@@ -95,15 +82,19 @@ def generate_answer(
 ) -> str:
     """
     Generates a medium-length, structured English answer using Gemini.
+    Raises UpstreamError / UpstreamTimeoutError / CircuitOpenError when
+    Gemini fails instead of returning the error as the answer.
     """
     # Safety: limit passage length so prompt doesn't explode
     PASSAGE_MAX_CHARS = 2000
-    passages = [p[:PASSAGE_MAX_CHARS] for p in passages]
-
-    prompt = build_prompt(question, passages)
-
-    try:
-        response = model.generate_content(
+    with stage_timer("prompt"):
+        passages = [p[:PASSAGE_MAX_CHARS] for p in passages]
+        prompt = build_prompt(question, passages)
+
+    # Failures raise rag.resilience.UpstreamError (the API maps them to 503/504)
+    with stage_timer("generate"):
+        response = generate_content(
+            MODEL_NAME,
             prompt,
             generation_config={
                 "temperature": 0.4,
@@ -111,14 +102,16 @@ def generate_answer(
             },
         )
 
-        if not response or not getattr(response, "text", None):
-            return "Model did not return a valid response."
+    try:
+        text = response.text if response else None
+    except ValueError:
+        # No text part (e.g. the candidate was blocked by safety filters)
+        text = None
 
-        return response.text.strip()
+    if not text:
+        return "Model did not return a valid response."
 
-    except Exception as e:
-        print("Gemini Error:", repr(e))
-        return f"Gemini error: {e}"
+    return text.strip()
 
 
 # Backwards compatibility alias
@@ -0,0 +1,103 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# ===============================
+# Prometheus metrics (scraped at /metrics)
+# ===============================
+# Buckets cover both sub-ms FAISS searches and multi-second Gemini calls.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of the RAG pipeline.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+INFLIGHT_REQUESTS = Gauge(
+    "rag_inflight_requests",
+    "Requests currently being processed.",
+    ["endpoint"],
+)
+
+CACHE_HITS = Counter("rag_cache_hits_total", "Cache lookups that found an entry.", ["cache"])
+CACHE_MISSES = Counter("rag_cache_misses_total", "Cache lookups that missed.", ["cache"])
+CACHE_HIT_RATIO = Gauge("rag_cache_hit_ratio", "Hit ratio of each cache since process start.", ["cache"])
+CACHE_ENTRIES = Gauge("rag_cache_entries", "Entries currently held by each cache.", ["cache"])
+
+INDEX_VECTORS = Gauge("rag_index_vectors", "Vectors in each loaded FAISS index.", ["collection"])
+INDEX_BYTES = Gauge("rag_index_bytes", "Approximate memory of each loaded collection (index + metadata).", ["collection"])
+COLLECTION_MEMORY_BYTES = Gauge("rag_collections_memory_bytes", "Approximate memory of all loaded collections.")
+INGEST_JOBS = Gauge("rag_ingest_jobs", "Ingestion jobs by status (finished jobs: recent history).", ["status"])
+COLLECTION_EVICTIONS = Counter("rag_collection_evictions_total", "Collections evicted from memory (LRU).")
+
+UPSTREAM_CALLS = Counter(
+    "rag_upstream_calls_total",
+    "Gemini call attempts by outcome (success, error, timeout, retry, hedged, rejected).",
+    ["upstream", "outcome"],
+)
+CIRCUIT_STATE = Gauge("rag_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", ["upstream"])
+WARMED_QUERIES = Counter("rag_warmed_queries_total", "Frequent questions pre-computed by cache warming.", ["collection"])
+RERANK_OUTCOMES = Counter(
+    "rag_rerank_total",
+    "Rerank calls by outcome (full, partial, budget_exceeded, not_ready, error).",
+    ["outcome"],
+)
+
+
+# Per-request stage breakdown (only filled inside collect_stage_timings)
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings() -> Iterator[Dict[str, float]]:
+    """
+    Collects the durations of all stage_timer blocks run inside it
+    (same thread / task) into the yielded dict: {stage: seconds}.
+    """
+    timings: Dict[str, float] = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Times the block into the stage histogram and the current request breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+_cache_counts: Dict[str, list] = {}
+_cache_lock = threading.Lock()
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    if hit:
+        CACHE_HITS.labels(cache=cache).inc()
+    else:
+        CACHE_MISSES.labels(cache=cache).inc()
+
+    with _cache_lock:
+        counts = _cache_counts.setdefault(cache, [0, 0])
+        counts[0 if hit else 1] += 1
+        ratio = counts[0] / (counts[0] + counts[1])
+    CACHE_HIT_RATIO.labels(cache=cache).set(ratio)
@@ -1,25 +1,113 @@
 import json
-import faiss
 import numpy as np
 import os
-import google.generativeai as genai
+import uuid
+from typing import Dict, Optional
+
+from .cache import LRUCache
+from .gemini_client import embed_content
+from .metrics import stage_timer
 
 # ===============================
-# Gemini setup
+# Gemini setup (configured lazily on first embedding call)
 # ===============================
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError("ERROR: GEMINI_API_KEY missing!")
+EMBED_MODEL = "models/text-embedding-004"
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Query embeddings are shared by every FAISSQuery instance (same model → same vector)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+embedding_cache = LRUCache("query_embedding", maxsize=EMBED_CACHE_SIZE)
 
-EMBED_MODEL = "models/text-embedding-004"
+# batchEmbedContents accepts at most 100 texts per call
+EMBED_BATCH_SIZE = 100
+
+# Retrieval results: {(FAISSQuery.version, question): (k, top-k results)}.
+# A hot-swapped collection gets a new version, so stale results are never served.
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+retrieval_cache = LRUCache("retrieval", maxsize=RETRIEVAL_CACHE_SIZE)
+
+# Upper bound for distance-threshold searches (a loose threshold could match the whole corpus)
+RANGE_MAX_RESULTS = int(os.getenv("RANGE_MAX_RESULTS", "200"))
+
+
+def normalize_query(text: str) -> str:
+    """Whitespace-normalized question (cache key for embeddings, results and the query log)."""
+    return " ".join(text.split())
+
+
+def embed_texts(texts, task_type="retrieval_query", batch_size=EMBED_BATCH_SIZE, caller=None) -> np.ndarray:
+    """
+    Embeds many texts with one API call per batch (instead of one per text).
+    Returns a float32 array of shape (len(texts), dim).
+    caller: ResilientCaller to go through (default: the live query path's).
+    """
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        batch = list(texts[start:start + batch_size])
+        # Large batches are slow by nature: retried, but not hedged
+        response = embed_content(
+            model=EMBED_MODEL,
+            content=batch,
+            task_type=task_type,
+            hedge=False,
+            caller=caller,
+        )
+        batches.append(np.array(response["embedding"], dtype=np.float32).reshape(len(batch), -1))
+
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(batches)
+
+
+# ===============================
+# Sharded indexes (src/shard_index.py --mode shards)
+# ===============================
+# data/faiss_index.bin → data/faiss_index.shards.json + data/faiss_index.shard000.bin, ...
+def shard_manifest_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + ".shards.json"
+
+
+def read_index(index_path: str):
+    """
+    Reads a FAISS index; returns (index, size_bytes).
+    If index_path does not exist but a shard manifest does, the shards are
+    loaded into one faiss.IndexShards: every search runs on all shards in
+    parallel and their top-k results are merged (ids stay global, so they
+    still match the metadata order).
+    """
+    # faiss is imported here (not at module import) to keep app startup fast
+    import faiss
+
+    manifest_path = shard_manifest_path(index_path)
+    if os.path.exists(index_path) or not os.path.exists(manifest_path):
+        return faiss.read_index(index_path), os.path.getsize(index_path)
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(manifest_path)
+    index = faiss.IndexShards(manifest["dim"], True, True)  # threaded, successive ids
+    size = 0
+    for shard in manifest["shards"]:
+        path = os.path.join(base_dir, shard["path"])
+        index.add_shard(faiss.read_index(path))
+        size += os.path.getsize(path)
+    return index, size
 
 
 class FAISSQuery:
     def __init__(self, index_path="data/faiss_index.bin", metadata_path="data/faiss_metadata.json"):
-        # Load FAISS
-        self.index = faiss.read_index(index_path)
+        # Load FAISS (single file or shards)
+        self.index, index_bytes = read_index(index_path)
+
+        # Approximate resident size (used for the collection memory budget)
+        self.memory_bytes = index_bytes + os.path.getsize(metadata_path)
+
+        # Identifies this loaded version in retrieval_cache
+        self.version = uuid.uuid4().hex
+
+        # {"index": ..., "metadata": ...} GCS generations this version was
+        # downloaded from / published as (None: local files); set by collection_store
+        self.gcs_generations: Optional[Dict[str, Optional[int]]] = None
 
         # Load metadata
         with open(metadata_path, "r", encoding="utf-8") as f:
@@ -30,28 +118,84 @@ class FAISSQuery:
     # --------------------------
     def embed_query(self, text: str) -> np.ndarray:
         """Generate embedding using Gemini (must match index embeddings)."""
-
-        response = genai.embed_content(
-            model=EMBED_MODEL,
-            content=text,
-            task_type="retrieval_query"
-        )
-
-        embedding = np.array(response["embedding"], dtype=np.float32)
-        return embedding.reshape(1, -1)
+        text = normalize_query(text)
+        cached = embedding_cache.get(text)
+        if cached is not None:
+            return cached
+
+        with stage_timer("embed"):
+            response = embed_content(
+                model=EMBED_MODEL,
+                content=text,
+                task_type="retrieval_query"
+            )
+
+        embedding = np.array(response["embedding"], dtype=np.float32).reshape(1, -1)
+        embedding_cache.put(text, embedding)
+        return embedding
 
     # --------------------------
     # FAISS retrieval
     # --------------------------
     def query(self, text: str, top_k: int = 5):
+        # Cached results for at least top_k passages (e.g. from cache warming)
+        text = normalize_query(text)
+        cached = retrieval_cache.get((self.version, text))
+        if cached is not None and cached[0] >= top_k:
+            return cached[1][:top_k]
+
         # Embed query
         vec = self.embed_query(text)
 
         # Search FAISS
-        distances, indices = self.index.search(vec, top_k)
+        with stage_timer("search"):
+            distances, indices = self.index.search(vec, top_k)
+
+        results = self._results(indices[0], distances[0])
+        retrieval_cache.put((self.version, text), (top_k, results))
+        return results
+
+    def warm(self, texts, top_k: int) -> int:
+        """
+        Fills the retrieval cache for every text whose embedding is already
+        cached, with one batched search (no Gemini calls). Returns the count.
+        """
+        texts = [t for t in map(normalize_query, texts) if embedding_cache.peek(t) is not None]
+        if not texts:
+            return 0
+
+        vectors = np.vstack([embedding_cache.peek(t) for t in texts])
+        distances, indices = self.index.search(vectors, top_k)
+        for text, row_indices, row_distances in zip(texts, indices, distances):
+            retrieval_cache.put((self.version, text), (top_k, self._results(row_indices, row_distances)))
+        return len(texts)
+
+    def range_query(self, text: str, max_distance: float, max_results: int = RANGE_MAX_RESULTS):
+        """
+        Every passage closer than max_distance (same scale as query()'s
+        "distance": squared L2), closest first, at most max_results.
+        The number of results adapts to the question instead of a fixed top_k.
+        """
+        vec = self.embed_query(text)
+
+        with stage_timer("search"):
+            try:
+                lims, distances, indices = self.index.range_search(vec, max_distance)
+                distances, indices = distances[lims[0]:lims[1]], indices[lims[0]:lims[1]]
+            except RuntimeError:
+                # No range_search (e.g. faiss.IndexShards): the capped top-k filtered
+                # by distance is the same result
+                distances, indices = self.index.search(vec, max_results)
+                keep = (indices[0] >= 0) & (distances[0] < max_distance)
+                distances, indices = distances[0][keep], indices[0][keep]
+
+            order = np.argsort(distances, kind="stable")[:max_results]
+
+        return self._results(indices[order], distances[order])
 
+    def _results(self, indices, distances):
         results = []
-        for idx, dist in zip(indices[0], distances[0]):
+        for idx, dist in zip(indices, distances):
             if idx < 0 or idx >= len(self.metadata):
                 continue
 
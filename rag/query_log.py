@@ -0,0 +1,160 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from .gcs_utils import download_gcs_generation, is_precondition_failed, upload_file_to_gcs
+from .query_faiss import normalize_query
+
+# ===============================
+# Query frequency log (used to warm caches after a cold start)
+# ===============================
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "1") == "1"
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "data/query_log.json")
+# Shared by all instances; SKIP_GCS_DOWNLOAD=1 keeps the log local only
+QUERY_LOG_GCS_PATH = os.getenv("QUERY_LOG_GCS_PATH", "logs/query_log.json")
+# Questions kept per save (least frequent are dropped), and how often to save
+QUERY_LOG_MAX_ENTRIES = int(os.getenv("QUERY_LOG_MAX_ENTRIES", "5000"))
+QUERY_LOG_FLUSH_S = float(os.getenv("QUERY_LOG_FLUSH_S", "300"))
+# Read-merge-write attempts when another instance saved the log meanwhile
+QUERY_LOG_FLUSH_ATTEMPTS = 5
+
+
+class QueryLog:
+    """
+    Compact {(collection, question): count} log.
+
+    record() only touches memory. flush() merges the counts recorded since
+    the last flush into the stored log (GCS or a local file) and keeps the
+    max_entries most frequent questions. The GCS upload only succeeds if the
+    log is still the generation that was read; otherwise the merge is redone,
+    so several instances add up instead of overwriting each other.
+    """
+
+    def __init__(
+        self,
+        path: str = QUERY_LOG_PATH,
+        gcs_path: Optional[str] = QUERY_LOG_GCS_PATH,
+        max_entries: int = QUERY_LOG_MAX_ENTRIES,
+        bucket_name: Optional[str] = None,
+    ):
+        self.path = path
+        self.gcs_path = gcs_path
+        self.max_entries = max_entries
+        self.bucket_name = bucket_name
+
+        self._counts: Counter = Counter()
+        self._pending: Counter = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # --------------------------
+    # Recording / reading
+    # --------------------------
+    def record(self, collection_id: str, question: str) -> None:
+        key = (collection_id, normalize_query(question))
+        if not key[1]:
+            return
+        with self._lock:
+            self._counts[key] += 1
+            self._pending[key] += 1
+
+    def top(self, collection_id: str, n: int) -> List[str]:
+        """The n most frequent questions of a collection."""
+        with self._lock:
+            ranked = [(q, c) for (cid, q), c in self._counts.items() if cid == collection_id]
+        ranked.sort(key=lambda qc: (-qc[1], qc[0]))
+        return [q for q, _ in ranked[:n]]
+
+    # --------------------------
+    # Persistence
+    # --------------------------
+    def load(self) -> int:
+        """Loads the stored log (keeps anything recorded meanwhile). Returns the number of entries."""
+        stored, _ = self._read_stored()
+        with self._lock:
+            self._counts = stored + self._pending
+            return len(self._counts)
+
+    def flush(self) -> None:
+        """Adds the pending counts to the stored log and writes it back."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            if not pending:
+                return
+
+            try:
+                merged = self._merge_and_write(pending)
+            except Exception:
+                # Keep the counts for the next flush
+                with self._lock:
+                    self._pending.update(pending)
+                raise
+
+            with self._lock:
+                self._counts = merged + self._pending
+
+    def start_flusher(self, interval_s: float = QUERY_LOG_FLUSH_S) -> threading.Thread:
+        """Flushes every interval_s in a daemon thread until stop()."""
+
+        def loop() -> None:
+            while not self._stop.wait(interval_s):
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"[QUERY LOG] Flush failed: {e!r}")
+
+        thread = threading.Thread(target=loop, name="query-log-flush", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _merge_and_write(self, pending: Counter) -> Counter:
+        attempt = 0
+        while True:
+            try:
+                stored, generation = self._read_stored()
+                merged = self._compact(stored + pending)
+                self._write_stored(merged, generation)
+                return merged
+            except Exception as e:
+                attempt += 1
+                if not is_precondition_failed(e) or attempt >= QUERY_LOG_FLUSH_ATTEMPTS:
+                    raise
+                # Another instance flushed in between: re-read its counts and merge again
+                time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+    def _compact(self, counts: Counter) -> Counter:
+        return Counter(dict(counts.most_common(self.max_entries)))
+
+    def _read_stored(self) -> Tuple[Counter, Optional[int]]:
+        """Stored counts + the GCS generation they were read from (None: local file only)."""
+        generation = None
+        if self.gcs_path:
+            generation = download_gcs_generation(self.gcs_path, self.path, self.bucket_name)
+            if generation == 0:
+                return Counter(), generation
+        if not os.path.exists(self.path):
+            return Counter(), generation
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return Counter({(cid, q): int(c) for cid, q, c in data.get("queries", [])}), generation
+
+    def _write_stored(self, counts: Counter, generation: Optional[int] = None) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"queries": [[cid, q, c] for (cid, q), c in counts.most_common()]}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        if self.gcs_path:
+            upload_file_to_gcs(self.path, self.gcs_path, self.bucket_name, if_generation_match=generation)
+
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import RERANK_OUTCOMES
+
+# ===============================
+# Cross-encoder rerank (optional, CPU)
+# ===============================
+# FAISS returns RERANK_CANDIDATES passages, a small cross-encoder scores
+# (question, passage) pairs and only the best RERANK_TOP_N go to Gemini.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+# Per-request budget; passages not scored in time keep their FAISS order
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+# Tokens per (question, passage) pair; shorter = faster
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# int8 dynamic quantization of the Linear layers (~2-3x faster on CPU)
+RERANK_QUANTIZE = os.getenv("RERANK_QUANTIZE", "1") == "1"
+
+Scorer = Callable[[List[Tuple[str, str]]], np.ndarray]
+
+
+def load_cross_encoder(
+    model_name: str = RERANK_MODEL,
+    quantize: bool = RERANK_QUANTIZE,
+    max_length: int = RERANK_MAX_LENGTH,
+) -> Scorer:
+    """
+    Loads a sentence-transformers CrossEncoder on CPU and returns a scorer:
+    [(question, passage), ...] → relevance scores (higher = better).
+    torch / sentence_transformers are imported here (slow imports, only
+    needed when reranking is enabled).
+    """
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+    if quantize:
+        model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def score(pairs: List[Tuple[str, str]]) -> np.ndarray:
+        with torch.inference_mode():
+            return np.asarray(model.predict(pairs, batch_size=len(pairs), show_progress_bar=False))
+
+    return score
+
+
+class Reranker:
+    """
+    Time-budgeted rerank of FAISS results.
+
+    Candidates are scored in batches, in FAISS order. Before each batch the
+    expected batch time (running average) is checked against the remaining
+    budget, so the budget is not overrun by a batch that cannot finish.
+    Scored passages are ordered by score; unscored ones follow in FAISS
+    order. If the model is not loaded (yet) or fails, FAISS order is kept.
+    """
+
+    def __init__(
+        self,
+        scorer_factory: Callable[[], Scorer] = load_cross_encoder,
+        budget_ms: float = RERANK_BUDGET_MS,
+        batch_size: int = RERANK_BATCH_SIZE,
+        top_n: int = RERANK_TOP_N,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.scorer_factory = scorer_factory
+        self.budget_s = budget_ms / 1000.0
+        self.batch_size = batch_size
+        self.top_n = top_n
+        self._clock = clock
+
+        self._scorer: Optional[Scorer] = None
+        self._batch_s = 0.0  # running average of one full batch
+        self._lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        self._loader_lock = threading.Lock()  # not held while loading: requests never wait
+        self.load_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._scorer is not None
+
+    def load(self) -> None:
+        """
+        Loads the model and times one warm-up batch (first batches are slow).
+        Warm-up passages are RERANK_MAX_LENGTH words long like real chunks, so
+        the first budget check is not based on the time of tiny inputs.
+        """
+        with self._lock:
+            if self._scorer is not None:
+                return
+            try:
+                scorer = self.scorer_factory()
+                passage = " ".join(["passage"] * RERANK_MAX_LENGTH)
+                pairs = [("What does this passage explain?", passage)] * self.batch_size
+                scorer(pairs)
+                start = self._clock()
+                scorer(pairs)
+                self._batch_s = self._clock() - start
+                self._scorer = scorer
+                print(f"[RERANK] Model ready ({self._batch_s * 1000:.1f} ms per batch of {self.batch_size}).")
+            except Exception as e:
+                self.load_error = repr(e)
+                print(f"[ERROR] Failed to load rerank model: {e!r}")
+
+    def start_loading(self) -> threading.Thread:
+        """Loads the model in a daemon thread (only the first call starts one)."""
+        with self._loader_lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=self.load, name="load-reranker", daemon=True)
+                self._loader.start()
+            return self._loader
+
+    def rerank(self, question: str, passages: Sequence[dict], top_n: Optional[int] = None) -> List[dict]:
+        """
+        Returns the best top_n passages (copies, with "rerank_score"; None when
+        a passage was not scored).
+        """
+        top_n = self.top_n if top_n is None else top_n
+        scorer = self._scorer
+        if scorer is None:
+            RERANK_OUTCOMES.labels(outcome="not_ready").inc()
+            return [dict(p, rerank_score=None) for p in passages[:top_n]]
+
+        deadline = self._clock() + self.budget_s
+        scores: List[float] = []
+        try:
+            for start in range(0, len(passages), self.batch_size):
+                batch = passages[start:start + self.batch_size]
+                now = self._clock()
+                if now + self._batch_s * len(batch) / self.batch_size > deadline:
+                    break
+                scores.extend(float(s) for s in scorer([(question, p.get("text", "")) for p in batch]))
+                self._observe(self._clock() - now, len(batch))
+        except Exception as e:
+            print(f"[ERROR] Rerank failed, keeping FAISS order: {e!r}")
+            RERANK_OUTCOMES.labels(outcome="error").inc()
+            return [dict(p, rerank_score=None) for p in passages[:top_n]]
+
+        scored = len(scores)
+        RERANK_OUTCOMES.labels(
+            outcome="full" if scored == len(passages) else ("partial" if scored else "budget_exceeded")
+        ).inc()
+
+        # sorted() is stable: equal scores keep FAISS order
+        order = sorted(range(scored), key=lambda i: -scores[i]) + list(range(scored, len(passages)))
+        return [
+            dict(passages[i], rerank_score=scores[i] if i < scored else None) for i in order[:top_n]
+        ]
+
+    def _observe(self, elapsed: float, batch_len: int) -> None:
+        per_batch = elapsed * self.batch_size / max(batch_len, 1)
+        with self._lock:
+            self._batch_s = per_batch if self._batch_s == 0 else 0.8 * self._batch_s + 0.2 * per_batch
@@ -0,0 +1,252 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional, TypeVar
+
+from .metrics import CIRCUIT_STATE, UPSTREAM_CALLS
+
+T = TypeVar("T")
+
+# HTTP status codes worth retrying (google.api_core exceptions carry them in .code)
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Threads per upstream: at least request concurrency (FastAPI's threadpool: 40)
+# x 2 for hedged requests, so calls do not queue behind each other
+UPSTREAM_MAX_WORKERS = int(os.getenv("UPSTREAM_MAX_WORKERS", "100"))
+
+
+class UpstreamError(RuntimeError):
+    """An upstream call (Gemini) failed after all attempts."""
+
+
+class UpstreamTimeoutError(UpstreamError):
+    """An upstream call did not finish within its deadline."""
+
+
+class _NotStarted(TimeoutError):
+    """No worker thread picked the call up before the deadline (not an upstream failure)."""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open; the call was rejected without being sent."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors and 408/429/5xx responses; not 4xx or programming errors."""
+    if isinstance(exc, OSError):  # includes TimeoutError / ConnectionError
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS
+
+
+def is_timeout(exc: BaseException) -> bool:
+    """Our own attempt timeout, or the upstream/HTTP client reporting one (e.g. 504 DeadlineExceeded)."""
+    return isinstance(exc, TimeoutError) or getattr(exc, "code", None) in (408, 504) or "Timeout" in type(exc).__name__
+
+
+class CircuitBreaker:
+    """
+    closed → open after `failure_threshold` consecutive failures; while open
+    calls fail fast. After `reset_after_s` one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_after_s: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after_s = reset_after_s
+        self._clock = clock
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(upstream=name).set(0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError when the call must not be sent."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._set_state(self.HALF_OPEN)
+                return
+            retry_after = max(self._opened_at + self.reset_after_s - self._clock(), 0.0)
+
+        UPSTREAM_CALLS.labels(upstream=self.name, outcome="rejected").inc()
+        raise CircuitOpenError(f"{self.name}: circuit open after repeated upstream failures", retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_ignored(self) -> None:
+        """The call failed for a reason unrelated to upstream health (e.g. a 400)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_in_flight
+            self._trial_in_flight = False
+            if trial_failed or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._set_state(self.OPEN)
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_after_s:
+            return self.HALF_OPEN
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        CIRCUIT_STATE.labels(upstream=self.name).set(self._STATE_VALUES[state])
+
+
+class ResilientCaller:
+    """
+    Wraps calls to one upstream (e.g. Gemini embedding) with:
+    - a per-attempt timeout and an overall deadline for the call,
+    - retries with full-jitter exponential backoff (retryable errors only),
+    - an optional hedged request: if the first attempt has not answered
+      after `hedge_after_s`, a second one is sent and the first answer wins,
+    - a circuit breaker that fails fast under sustained errors.
+
+    The wrapped function gets the attempt timeout as its `timeout` keyword
+    so the HTTP request itself is bounded too; a timed-out attempt is
+    abandoned (threads cannot be cancelled) and finishes in the background.
+    The attempt timeout starts when a worker thread runs the call, so time
+    queued for a thread only counts against the overall deadline.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout_s: float,
+        deadline_s: float,
+        max_attempts: int = 3,
+        backoff_base_s: float = 0.2,
+        backoff_max_s: float = 2.0,
+        hedge_after_s: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_workers: int = UPSTREAM_MAX_WORKERS,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ):
+        self.name = name
+        self.timeout_s = timeout_s
+        self.deadline_s = deadline_s
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge_after_s = hedge_after_s or None
+        self.breaker = breaker or CircuitBreaker(name)
+        self.retryable = retryable
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"upstream-{name}")
+
+    def call(self, fn: Callable[..., T], hedge: bool = True) -> T:
+        """
+        Runs fn(timeout=<seconds>) with retries/hedging/breaker.
+        Raises CircuitOpenError, UpstreamTimeoutError or UpstreamError
+        (the last underlying exception is chained as __cause__).
+        """
+        deadline = time.monotonic() + self.deadline_s
+        last_exc: Optional[BaseException] = None
+
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            self.breaker.before_call()
+            try:
+                result = self._attempt(fn, min(self.timeout_s, remaining), hedge, deadline)
+            except _NotStarted as e:
+                # Local thread pool saturation says nothing about upstream health
+                last_exc = e
+                self.breaker.record_ignored()
+                UPSTREAM_CALLS.labels(upstream=self.name, outcome="timeout").inc()
+                break
+            except Exception as e:
+                last_exc = e
+                UPSTREAM_CALLS.labels(upstream=self.name, outcome="timeout" if is_timeout(e) else "error").inc()
+
+                if not self.retryable(e):
+                    # Client-side errors (bad request, missing key) say nothing about upstream health
+                    self.breaker.record_ignored()
+                    raise UpstreamError(f"{self.name}: {e}") from e
+
+                self.breaker.record_failure()
+                if attempt + 1 < self.max_attempts:
+                    sleep = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+                    if time.monotonic() + sleep >= deadline:
+                        break
+                    UPSTREAM_CALLS.labels(upstream=self.name, outcome="retry").inc()
+                    time.sleep(sleep)
+                continue
+
+            self.breaker.record_success()
+            UPSTREAM_CALLS.labels(upstream=self.name, outcome="success").inc()
+            return result
+
+        if last_exc is None or is_timeout(last_exc):
+            raise UpstreamTimeoutError(f"{self.name}: no response within {self.deadline_s:g}s") from last_exc
+        raise UpstreamError(f"{self.name}: {last_exc}") from last_exc
+
+    def _attempt(self, fn: Callable[..., T], timeout: float, hedge: bool, deadline: float) -> T:
+        """One logical attempt (possibly two hedged requests); raises TimeoutError on timeout."""
+        started = threading.Event()
+
+        def run() -> T:
+            started.set()
+            return fn(timeout=timeout)
+
+        first = self._pool.submit(run)
+        if not started.wait(max(deadline - time.monotonic(), 0)):
+            first.cancel()
+            raise _NotStarted(f"{self.name}: no worker thread free before the deadline")
+
+        start = time.monotonic()
+        futures = [first]
+
+        if hedge and self.hedge_after_s is not None and self.hedge_after_s < timeout:
+            done, _ = wait(futures, timeout=self.hedge_after_s)
+            if not done:
+                UPSTREAM_CALLS.labels(upstream=self.name, outcome="hedged").inc()
+                futures.append(self._pool.submit(fn, timeout=timeout - self.hedge_after_s))
+
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            left = min(timeout - (time.monotonic() - start), deadline - time.monotonic())
+            done, pending = wait(pending, timeout=max(left, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not pending:
+            raise error
+        raise TimeoutError(f"{self.name}: attempt timed out after {timeout:.2f}s")
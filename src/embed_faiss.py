@@ -2,21 +2,28 @@ import os
 import json
 import faiss
 import numpy as np
-import google.generativeai as genai
 
-from rag.gcs_utils import upload_file_to_gcs
+from rag.gcs_utils import delete_file_from_gcs, upload_file_to_gcs
+from rag.gemini_client import get_genai
+from src.quantize import build_index, save_embeddings
+from src.shard_index import build_sharded_index
 
 
 # =============================================
-# 1) Configure Gemini API
+# 1) Gemini API (configured on first embedding call, see rag/gemini_client.py)
 # =============================================
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY is missing in environment!")
+EMBED_MODEL = "models/text-embedding-004"  # Latest + Best for embeddings
 
-genai.configure(api_key=GEMINI_API_KEY)
+# faiss.index_factory spec: "Flat" (exact, float32), "SQfp16", "SQ8" (4x smaller), "PQ96x4", ...
+# Compare memory / recall trade-offs with: python src/quantize.py
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "Flat")
 
-EMBED_MODEL = "models/text-embedding-004"  # Latest + Best for embeddings
+# Storage dtype of the uploaded embeddings copy: float32 | float16 | int8
+EMBEDDINGS_DTYPE = os.getenv("EMBEDDINGS_DTYPE", "float32")
+
+# "" → single-process build; "merge" / "shards" → parallel sharded build with
+# bounded memory (FAISS_BUILD_WORKERS, FAISS_BUILD_MEMORY_MB), see src/shard_index.py
+FAISS_SHARD_MODE = os.getenv("FAISS_SHARD_MODE", "")
 
 
 # =============================================
@@ -27,10 +34,10 @@ def load_chunks(chunks_path="data/chunks.json"):
         return json.load(f)
 
 
-def build_or_load_embeddings(texts, embeddings_path="data/embeddings.npy"):
+def build_or_load_embeddings(texts, embeddings_path="data/embeddings.npy", mmap_mode=None):
     if os.path.exists(embeddings_path):
         print("Embeddings found. Loading from cache...")
-        arr = np.load(embeddings_path)
+        arr = np.load(embeddings_path, mmap_mode=mmap_mode)
         print(f"Loaded embeddings with shape: {arr.shape}")
         return arr
 
@@ -39,7 +46,7 @@ def build_or_load_embeddings(texts, embeddings_path="data/embeddings.npy"):
     embeddings = []
 
     for i, text in enumerate(texts):
-        response = genai.embed_content(
+        response = get_genai().embed_content(
             model=EMBED_MODEL,
             content=text,
             task_type="retrieval_document",
@@ -72,12 +79,15 @@ def build_or_load_embeddings(texts, embeddings_path="data/embeddings.npy"):
     return embeddings
 
 
-def build_faiss_index(embeddings, index_path="data/faiss_index.bin"):
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+def build_faiss_index(embeddings, index_path="data/faiss_index.bin", index_type=FAISS_INDEX_TYPE):
+    if index_type == "Flat":
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+        index.add(embeddings)
+    else:
+        # Quantized variants need training on the embeddings first
+        index = build_index(index_type, embeddings)
 
-    print(f"FAISS index built with {index.ntotal} vectors.")
+    print(f"FAISS index ({index_type}) built with {index.ntotal} vectors.")
     faiss.write_index(index, index_path)
     print(f"FAISS index saved to {index_path}")
 
@@ -110,17 +120,36 @@ def main():
     texts = [c["text"] for c in chunks]
     print(f"Loaded {len(texts)} chunks.")
 
-    embeddings = build_or_load_embeddings(texts)
+    # Sharded builds read the cached embeddings from disk in chunks
+    embeddings = build_or_load_embeddings(texts, mmap_mode="r" if FAISS_SHARD_MODE else None)
 
-    build_faiss_index(embeddings)
+    index_files = ["data/faiss_index.bin"]
+    if FAISS_SHARD_MODE:
+        index_files = build_sharded_index("data/embeddings.npy", "data/faiss_index.bin",
+                                          FAISS_INDEX_TYPE, FAISS_SHARD_MODE)["files"]
+    else:
+        build_faiss_index(embeddings)
     save_metadata(chunks)
 
     bucket_name = os.getenv("GCS_BUCKET_NAME", "rag-documents-bucket-icu")
 
-    upload_file_to_gcs("data/faiss_index.bin", "faiss/faiss_index.bin", bucket_name)
-    upload_file_to_gcs("data/faiss_metadata.json", "faiss/faiss_metadata.json", bucket_name)
-    upload_file_to_gcs("data/chunks.json", "faiss/chunks.json", bucket_name)
-    upload_file_to_gcs("data/embeddings.npy", "faiss/embeddings.npy", bucket_name)
+    # COLLECTION_ID set → upload as that course (gs://bucket/faiss/<id>/), served via /ask "collection"
+    collection_id = os.getenv("COLLECTION_ID")
+    prefix = f"faiss/{collection_id}" if collection_id else "faiss"
+
+    for path in index_files:
+        upload_file_to_gcs(path, f"{prefix}/{os.path.basename(path)}", bucket_name)
+    # The API prefers faiss_index.bin over a shard manifest: drop the other layout
+    stale = "faiss_index.bin" if FAISS_SHARD_MODE == "shards" else "faiss_index.shards.json"
+    delete_file_from_gcs(f"{prefix}/{stale}", bucket_name)
+    upload_file_to_gcs("data/faiss_metadata.json", f"{prefix}/faiss_metadata.json", bucket_name)
+    upload_file_to_gcs("data/chunks.json", f"{prefix}/chunks.json", bucket_name)
+    # Local cache stays float32; the uploaded copy uses EMBEDDINGS_DTYPE
+    embedding_files = ["data/embeddings.npy"]
+    if EMBEDDINGS_DTYPE != "float32":
+        embedding_files = save_embeddings(embeddings, "data/embeddings.npy", EMBEDDINGS_DTYPE)
+    for path in embedding_files:
+        upload_file_to_gcs(path, f"{prefix}/{os.path.basename(path)}", bucket_name)
 
     print("All FAISS files uploaded to GCS.")
 
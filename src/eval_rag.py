@@ -1,59 +1,230 @@
 import sys
 import os
+import time
+import argparse
 from pathlib import Path
 import json
 
-sys.path.append(os.path.join(os.path.dirname(__file__), "..", "rag"))
-from query_faiss import FAISSQuery
+import numpy as np
 
-def evaluate(test_file="data/test_cases.json", k=3, output_failed="data/failed_cases.json"):
-    # Load test cases
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from rag.query_faiss import FAISSQuery, embed_texts
+from src.quantize import build_index
+
+
+# =============================================
+# Test cases
+# =============================================
+def load_cases(test_file):
+    """
+    Loads test cases and normalizes them to {"query": str, "gold": [str, ...]}.
+    Accepts both formats used in this repo:
+      - {"question": ..., "expected_keyword": ...}   (data/test_cases.json)
+      - {"query": ..., "gold_passages": [...]}         (tests/evaluation/gold_passages.json)
+    """
     with open(test_file, "r", encoding="utf-8") as f:
-        test_cases = json.load(f)
+        raw = json.load(f)
+
+    cases = []
+    for c in raw:
+        query = c.get("query", c.get("question"))
+        gold = c.get("gold_passages", c.get("expected_keyword"))
+        if isinstance(gold, str):
+            gold = [gold]
+        cases.append({"query": query, "gold": list(gold)})
+    return cases
+
+
+def corpus_texts(metadata):
+    """Lowercased text + title + source of every chunk (what a gold string is matched against)."""
+    return [
+        " ".join([m.get("text", ""), m.get("title") or "", m.get("source") or ""]).lower()
+        for m in metadata
+    ]
+
+
+def relevance(cases, indices, texts):
+    """
+    Judges one (n_queries, max_k) result matrix in one pass.
+
+    Returns:
+      rel:        bool (n_queries, max_k) – retrieved chunk contains any gold string
+      gold_rank:  int  (n_queries, max_gold) – first rank where each gold string was found,
+                  max_k if not found, -1 for padding
+      n_relevant: int  (n_queries,) – relevant chunks in the whole corpus (for ideal DCG)
+    """
+    n, max_k = indices.shape
+    max_gold = max(len(c["gold"]) for c in cases)
+
+    rel = np.zeros((n, max_k), dtype=bool)
+    gold_rank = np.full((n, max_gold), -1, dtype=np.int64)
+    n_relevant = np.zeros(n, dtype=np.int64)
+
+    for q, case in enumerate(cases):
+        relevant_ids = set()
+        for g, gold in enumerate(case["gold"]):
+            gold = gold.lower()
+            matching = np.fromiter((i for i, t in enumerate(texts) if gold in t), dtype=np.int64)
+            relevant_ids.update(matching.tolist())
+
+            found = np.isin(indices[q], matching)
+            gold_rank[q, g] = int(np.argmax(found)) if found.any() else max_k
+            rel[q] |= found
+
+        n_relevant[q] = len(relevant_ids)
+
+    return rel, gold_rank, n_relevant
+
+
+def ranking_metrics(rel, gold_rank, n_relevant, ks):
+    """
+    Hit / Precision / Recall / MRR / nDCG at every k, from the same result matrix.
+    Recall@k = fraction of a query's gold strings found in its top-k.
+    """
+    max_k = rel.shape[1]
+    discounts = 1.0 / np.log2(np.arange(2, max_k + 2))
+    ideal_dcg = np.cumsum(discounts)
+
+    has_gold = gold_rank >= 0
+    first_hit = np.where(rel.any(axis=1), rel.argmax(axis=1), max_k)
+
+    out = {}
+    for cutoff in ks:
+        k = min(cutoff, max_k)
+        top = rel[:, :k]
+
+        found = (gold_rank < k) & has_gold
+        recall = found.sum(axis=1) / np.maximum(has_gold.sum(axis=1), 1)
+
+        dcg = (top * discounts[:k]).sum(axis=1)
+        ideal = np.where(n_relevant > 0, ideal_dcg[np.clip(np.minimum(n_relevant, k) - 1, 0, None)], 1.0)
+        ndcg = np.where(n_relevant > 0, dcg / ideal, 0.0)
+
+        mrr = np.where(first_hit < k, 1.0 / (first_hit + 1), 0.0)
 
-    faiss_query = FAISSQuery()
-    total = len(test_cases)
-    correct = 0
+        out[cutoff] = {
+            "hit": float(top.any(axis=1).mean()),
+            "precision": float((top.sum(axis=1) / k).mean()),
+            "recall": float(recall.mean()),
+            "mrr": float(mrr.mean()),
+            "ndcg": float(ndcg.mean()),
+        }
+    return out
+
+
+# =============================================
+# Index configurations (built with src.quantize.build_index)
+# =============================================
+def evaluate_index(index, query_vecs, cases, texts, ks):
+    """One batched search at max(ks); every metric at every k is derived from it."""
+    max_k = max(ks)
+
+    start = time.perf_counter()
+    _, indices = index.search(query_vecs, max_k)
+    search_s = time.perf_counter() - start
+
+    rel, gold_rank, n_relevant = relevance(cases, indices, texts)
+    return {
+        "metrics": ranking_metrics(rel, gold_rank, n_relevant, ks),
+        "search_s": search_s,
+        "per_query_ms": search_s / len(cases) * 1000.0,
+        "indices": indices,
+        "rel": rel,
+    }
+
+
+def print_report(name, result, ks):
+    timing = f"search {result['per_query_ms']:.3f} ms/query"
+    if "build_s" in result:
+        timing = f"build {result['build_s']:.2f}s, " + timing
+    print(f"\n=== {name} ({timing}) ===")
+    print(f"{'k':>4} {'Hit':>6} {'P':>6} {'R':>6} {'MRR':>6} {'nDCG':>6}")
+    for k in ks:
+        m = result["metrics"][k]
+        print(f"{k:>4} {m['hit']:>6.3f} {m['precision']:>6.3f} {m['recall']:>6.3f} {m['mrr']:>6.3f} {m['ndcg']:>6.3f}")
+
+
+# =============================================
+# Main evaluation
+# =============================================
+def evaluate(
+    test_file="data/test_cases.json",
+    ks=(1, 3, 5, 10),
+    index_specs=(),
+    index_path="data/faiss_index.bin",
+    metadata_path="data/faiss_metadata.json",
+    embeddings_path="data/embeddings.npy",
+    output_failed="data/failed_cases.json",
+    batch_size=100,
+):
+    """
+    Evaluates retrieval for all test cases at once:
+    1. Embeds every question in batches (one API call per batch).
+    2. Searches each index once at max(ks).
+    3. Computes Hit/Precision/Recall/MRR/nDCG at every k from that result matrix.
+    The deployed index is always evaluated; index_specs adds faiss.index_factory
+    configurations built from embeddings.npy, timed for build and search.
+    """
+    ks = sorted(set(ks))
+    cases = load_cases(test_file)
+
+    faiss_query = FAISSQuery(index_path=index_path, metadata_path=metadata_path)
+    texts = corpus_texts(faiss_query.metadata)
+
+    start = time.perf_counter()
+    query_vecs = embed_texts([c["query"] for c in cases], batch_size=batch_size)
+    print(f"Embedded {len(cases)} questions in {time.perf_counter() - start:.2f}s")
+
+    results = {"deployed": evaluate_index(faiss_query.index, query_vecs, cases, texts, ks)}
+
+    if index_specs:
+        embeddings = np.load(embeddings_path).astype(np.float32)
+        for spec in index_specs:
+            start = time.perf_counter()
+            index = build_index(spec, embeddings)
+            build_s = time.perf_counter() - start
+
+            results[spec] = evaluate_index(index, query_vecs, cases, texts, ks)
+            results[spec]["build_s"] = build_s
+
+    for name, result in results.items():
+        print_report(name, result, ks)
+
+    # Failed cases: no gold string anywhere in the deployed index's top max(ks)
+    deployed = results["deployed"]
     failed_cases = []
+    for q, case in enumerate(cases):
+        if deployed["rel"][q].any():
+            continue
+        failed_cases.append({
+            "question": case["query"],
+            "expected": case["gold"],
+            "results": [faiss_query.metadata[i] for i in deployed["indices"][q] if 0 <= i < len(faiss_query.metadata)],
+        })
 
-    for case in test_cases:
-        question = case["question"]
-        expected = case["expected_keyword"]
-
-        # Query the FAISS index
-        results = faiss_query.query(question, top_k=k)
-
-        # Check in text, title, and source
-        found = False
-        for r in results:
-            combined_fields = " ".join([r.get("text", ""), r.get("title", ""), r.get("source", "")]).lower()
-            if expected.lower() in combined_fields:
-                found = True
-                break
-
-        if found:
-            correct += 1
-        else:
-            failed_cases.append({
-                "question": question,
-                "expected": expected,
-                "results": results
-            })
-
-    # Calculate accuracy
-    accuracy = correct / total * 100
-
-    print(f"Total tests: {total}")
-    print(f"Correct matches: {correct}")
-    print(f"Accuracy: {accuracy:.2f}%")
-
-    # Save failed cases to JSON
     Path(output_failed).parent.mkdir(parents=True, exist_ok=True)
     with open(output_failed, "w", encoding="utf-8") as f:
         json.dump(failed_cases, f, ensure_ascii=False, indent=2)
-    
+
     if failed_cases:
-        print(f"\nFailed test cases saved to {output_failed}")
+        print(f"\n{len(failed_cases)} failed test cases saved to {output_failed}")
+
+    return {
+        name: {k: v for k, v in r.items() if k not in ("indices", "rel")}
+        for name, r in results.items()
+    }
+
 
 if __name__ == "__main__":
-    evaluate(k=5)  # You can adjust k for more or fewer results
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Batched retrieval evaluation.")
+    parser.add_argument("--test-file", default="data/test_cases.json")
+    parser.add_argument("--ks", default="1,3,5,10", help="Comma-separated cutoffs.")
+    parser.add_argument("--index", action="append", default=[],
+                        help='Extra faiss.index_factory spec to compare, e.g. --index HNSW32 --index "IVF64,Flat"')
+    args = parser.parse_args()
+
+    evaluate(
+        test_file=args.test_file,
+        ks=[int(k) for k in args.ks.split(",")],
+        index_specs=args.index,
+    )
@@ -0,0 +1,237 @@
+import io
+import os
+import gzip
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+
+# =============================================
+# Quantized embedding storage
+# =============================================
+# float32 → 4 bytes / dim, float16 → 2 bytes / dim, int8 → 1 byte / dim
+STORAGE_DTYPES = ("float32", "float16", "int8")
+# Rows converted at a time when saving (bounds the float32 temporaries)
+QUANTIZE_CHUNK_ROWS = 65536
+
+
+def quantize_embeddings(embeddings, dtype="int8"):
+    """
+    Returns (codes, params).
+    - float16: plain cast, params is None
+    - int8: per-dimension scalar quantization; params is a (2, dim) float32
+      array [min, scale] so that x ≈ (code + 128) * scale + min
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    if dtype == "float32":
+        return embeddings, None
+    params = quantization_params(embeddings, dtype)
+    return quantize_rows(embeddings, dtype, params), params
+
+
+def quantization_params(embeddings, dtype="int8", chunk_rows=QUANTIZE_CHUNK_ROWS):
+    """[min, scale] for int8 (None otherwise), from one pass over chunk_rows rows at a time."""
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype} (expected one of {STORAGE_DTYPES})")
+    if dtype != "int8":
+        return None
+
+    vmin = vmax = None
+    for start in range(0, len(embeddings), chunk_rows):
+        rows = np.asarray(embeddings[start:start + chunk_rows], dtype=np.float32)
+        lo, hi = rows.min(axis=0), rows.max(axis=0)
+        vmin = lo if vmin is None else np.minimum(vmin, lo)
+        vmax = hi if vmax is None else np.maximum(vmax, hi)
+
+    scale = (vmax - vmin) / 255.0
+    scale[scale == 0] = 1.0
+    return np.stack([vmin, scale]).astype(np.float32)
+
+
+def quantize_rows(rows, dtype, params=None):
+    rows = np.asarray(rows, dtype=np.float32)
+    if dtype == "float16":
+        return rows.astype(np.float16)
+    codes = np.rint((rows - params[0]) / params[1]) - 128
+    return np.clip(codes, -128, 127).astype(np.int8)
+
+
+def dequantize_embeddings(codes, params=None):
+    if codes.dtype == np.int8:
+        if params is None:
+            raise ValueError("int8 embeddings need their [min, scale] params to be dequantized")
+        return (codes.astype(np.float32) + 128.0) * params[1] + params[0]
+    return codes.astype(np.float32)
+
+
+def quantized_path(path, dtype):
+    """data/embeddings.npy + int8 → data/embeddings.int8.npy (float32 keeps the original name)."""
+    if dtype == "float32":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{dtype}{ext}"
+
+
+def params_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.qparams{ext}"
+
+
+def save_embeddings(embeddings, path="data/embeddings.npy", dtype="float32", chunk_rows=QUANTIZE_CHUNK_ROWS):
+    """
+    Saves embeddings with the given storage dtype.
+    Returns the list of written files (int8 also writes a small .qparams.npy sidecar).
+    float16 / int8 are converted chunk_rows rows at a time, so memory-mapped
+    embeddings (FAISS_SHARD_MODE) are never loaded as a whole.
+    """
+    out_path = quantized_path(path, dtype)
+    if dtype == "float32":
+        np.save(out_path, np.asarray(embeddings, dtype=np.float32))
+        return [out_path]
+
+    params = quantization_params(embeddings, dtype, chunk_rows)
+    codes = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=embeddings.shape)
+    for start in range(0, len(embeddings), chunk_rows):
+        codes[start:start + chunk_rows] = quantize_rows(embeddings[start:start + chunk_rows], dtype, params)
+    codes.flush()
+    del codes
+
+    written = [out_path]
+    if params is not None:
+        np.save(params_path(out_path), params)
+        written.append(params_path(out_path))
+    return written
+
+
+def load_embeddings(path, mmap_mode=None):
+    """Loads a float32 / float16 / int8 embeddings file and returns float32 vectors."""
+    codes = np.load(path, mmap_mode=mmap_mode)
+    params = np.load(params_path(path)) if codes.dtype == np.int8 else None
+    return dequantize_embeddings(codes, params)
+
+
+# =============================================
+# Index variants
+# =============================================
+def build_index(spec, embeddings):
+    """faiss.index_factory spec, e.g. "Flat", "HNSW32", "SQfp16", "SQ8", "PQ96x4", "IVF64,SQ8"."""
+    index = faiss.index_factory(embeddings.shape[1], spec)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def npy_bytes(arr) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, arr)
+    return buf.getvalue()
+
+
+def gzip_size(data: bytes) -> int:
+    return len(gzip.compress(data, compresslevel=6))
+
+
+def neighbors_without_self(index, queries, query_ids, k):
+    """Top-k ids for each query, ignoring the query vector itself."""
+    _, indices = index.search(queries, k + 1)
+    out = np.empty((len(queries), k), dtype=np.int64)
+    for row, (qid, ids) in enumerate(zip(query_ids, indices)):
+        out[row] = ids[ids != qid][:k]
+    return out
+
+
+def recall_against(baseline_ids, candidate_ids):
+    """Mean fraction of the float32 top-k that the candidate also returns."""
+    k = baseline_ids.shape[1]
+    hits = [len(np.intersect1d(b, c)) for b, c in zip(baseline_ids, candidate_ids)]
+    return float(np.mean(hits) / k)
+
+
+def compare(embeddings, index_specs=("SQfp16", "SQ8", "PQ96x4"), k=10, n_queries=500, seed=0):
+    """
+    Memory / disk / transfer size and recall@k versus the float32 Flat baseline,
+    for every storage dtype and every index variant.
+    Corpus vectors are used as queries (their own id excluded from the results).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[query_ids]
+
+    baseline = faiss.IndexFlatL2(embeddings.shape[1])
+    baseline.add(embeddings)
+    baseline_ids = neighbors_without_self(baseline, queries, query_ids, k)
+    baseline_bytes = embeddings.nbytes
+
+    rows = []
+
+    # Stored embeddings (embeddings.npy): exact search over the dequantized vectors
+    for dtype in STORAGE_DTYPES:
+        codes, params = quantize_embeddings(embeddings, dtype)
+        raw = codes.tobytes() + (params.tobytes() if params is not None else b"")
+        files = npy_bytes(codes) + (npy_bytes(params) if params is not None else b"")
+
+        restored = faiss.IndexFlatL2(embeddings.shape[1])
+        restored.add(dequantize_embeddings(codes, params))
+
+        rows.append({
+            "name": f"embeddings[{dtype}]",
+            "memory_bytes": len(raw),
+            "disk_bytes": len(files),
+            "transfer_bytes": gzip_size(files),
+            "saved": 1.0 - len(raw) / baseline_bytes,
+            "recall": recall_against(baseline_ids, neighbors_without_self(restored, queries, query_ids, k)),
+            "build_s": None,
+        })
+
+    # FAISS index variants (faiss_index.bin)
+    for spec in ("Flat",) + tuple(s for s in index_specs if s != "Flat"):
+        start = time.perf_counter()
+        index = build_index(spec, embeddings)
+        build_s = time.perf_counter() - start
+
+        serialized = faiss.serialize_index(index).tobytes()
+        rows.append({
+            "name": f"index[{spec}]",
+            # the serialized index is the in-memory codes + codebooks
+            "memory_bytes": len(serialized),
+            "disk_bytes": len(serialized),
+            "transfer_bytes": gzip_size(serialized),
+            "saved": 1.0 - len(serialized) / baseline_bytes,
+            "recall": recall_against(baseline_ids, neighbors_without_self(index, queries, query_ids, k)),
+            "build_s": build_s,
+        })
+
+    return rows
+
+
+def print_report(rows, k):
+    def mb(n):
+        return f"{n / 1e6:.2f}"
+
+    print(f"\n{'variant':<22} {'mem MB':>8} {'disk MB':>8} {'gzip MB':>8} {'saved':>7} {'recall@' + str(k):>10} {'build s':>8}")
+    for r in rows:
+        build = "-" if r["build_s"] is None else f"{r['build_s']:.2f}"
+        print(
+            f"{r['name']:<22} {mb(r['memory_bytes']):>8} {mb(r['disk_bytes']):>8} {mb(r['transfer_bytes']):>8} "
+            f"{r['saved'] * 100:>6.1f}% {r['recall']:>10.3f} {build:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare quantized embedding storage and FAISS index variants.")
+    parser.add_argument("--embeddings", default="data/embeddings.npy")
+    parser.add_argument("--index", action="append", default=[],
+                        help='faiss.index_factory spec to compare (default: SQfp16, SQ8, PQ96x4)')
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500, help="Number of corpus vectors used as queries.")
+    args = parser.parse_args()
+
+    emb = load_embeddings(args.embeddings)
+    print(f"Loaded embeddings with shape: {emb.shape}")
+    report = compare(emb, index_specs=args.index or ("SQfp16", "SQ8", "PQ96x4"), k=args.k, n_queries=args.queries)
+    print_report(report, args.k)
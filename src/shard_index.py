@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from rag.query_faiss import shard_manifest_path
+from src.quantize import dequantize_embeddings, params_path
+
+
+# =============================================
+# Sharded parallel index build
+# =============================================
+# The single-process build (embed_faiss.build_faiss_index) needs the whole
+# embeddings array in RAM and adds / trains on one core. Here embeddings are
+# read from the .npy file in chunks (memory-mapped), each shard is built in
+# its own worker process, and the shards are either merged into one index
+# (mode "merge") or written as separate files that the API serves with
+# faiss.IndexShards (mode "shards", top-k merged across shards).
+SHARD_MODES = ("merge", "shards")
+
+# Memory budget for training + the parallel phase (all workers together)
+BUILD_MEMORY_MB = float(os.getenv("FAISS_BUILD_MEMORY_MB", "2048"))
+BUILD_WORKERS = int(os.getenv("FAISS_BUILD_WORKERS", str(os.cpu_count() or 1)))
+
+# Vectors used to train quantizers / coarse centroids (IVF, PQ, SQ)
+TRAIN_SAMPLE = 100_000
+# Vectors added per index.add() call inside a worker (upper bound)
+MAX_CHUNK_ROWS = 65_536
+
+
+def open_embeddings(path):
+    """Memory-maps a float32 / float16 / int8 embeddings file; returns (codes, params)."""
+    codes = np.load(path, mmap_mode="r")
+    params = np.load(params_path(path)) if codes.dtype == np.int8 else None
+    return codes, params
+
+
+def read_rows(codes, params, start, stop):
+    """float32 copy of rows [start, stop) (only these rows are read from disk)."""
+    return np.ascontiguousarray(dequantize_embeddings(np.asarray(codes[start:stop]), params), dtype=np.float32)
+
+
+def train_template(codes, params, index_type, train_sample=TRAIN_SAMPLE, seed=0):
+    """
+    Empty index of the given faiss.index_factory spec, trained on a random
+    sample. Every shard starts from this template, so shards share their
+    quantizer / codebooks and can be merged (or searched together).
+    """
+    n, dim = codes.shape
+    index = faiss.index_factory(dim, index_type)
+    if not index.is_trained:
+        rows = np.sort(np.random.default_rng(seed).choice(n, size=min(n, train_sample), replace=False))
+        sample = dequantize_embeddings(np.asarray(codes[rows]), params).astype(np.float32)
+        print(f"Training {index_type} on {len(sample)} vectors ...")
+        index.train(sample)
+    return index
+
+
+def bytes_per_vector(template, codes, params, sample_rows=1000):
+    """Measured index growth per added vector (codes + ids + graph links, ...)."""
+    probe = faiss.clone_index(template)
+    empty = faiss.serialize_index(probe).size
+    rows = min(sample_rows, len(codes))
+    probe.add(read_rows(codes, params, 0, rows))
+    return max((faiss.serialize_index(probe).size - empty) / rows, 1.0)
+
+
+def plan_shards(n, dim, vector_bytes, workers, memory_mb):
+    """
+    Returns (shard_rows, chunk_rows) so that `workers` shards being built at
+    the same time stay within memory_mb: each worker holds its shard index
+    (shard_rows * vector_bytes) plus one float32 chunk being added.
+    """
+    per_worker = memory_mb * 1024 * 1024 / workers
+    chunk_rows = int(max(1, min(MAX_CHUNK_ROWS, per_worker * 0.2 / (dim * 4 * 2))))
+    shard_rows = int((per_worker - chunk_rows * dim * 4 * 2) / vector_bytes)
+    if shard_rows < chunk_rows:
+        raise ValueError(
+            f"FAISS_BUILD_MEMORY_MB={memory_mb:g} is too small for {workers} workers; "
+            f"raise it or use fewer workers."
+        )
+    # At least one shard per worker, otherwise the extra workers idle
+    shard_rows = min(shard_rows, math.ceil(n / workers))
+    return max(shard_rows, 1), min(chunk_rows, max(shard_rows, 1))
+
+
+def build_shard(embeddings_path, start, stop, template_path, out_path, chunk_rows, threads):
+    """Runs in a worker process: adds rows [start, stop) to a copy of the template."""
+    faiss.omp_set_num_threads(threads)
+    codes, params = open_embeddings(embeddings_path)
+    index = faiss.read_index(template_path)
+    for chunk_start in range(start, stop, chunk_rows):
+        index.add(read_rows(codes, params, chunk_start, min(chunk_start + chunk_rows, stop)))
+    faiss.write_index(index, out_path)
+    return index.ntotal
+
+
+def merge_shards(shard_paths):
+    """
+    Merges shard files into one index, one shard at a time (peak memory:
+    the merged index + one shard). IVF indexes store ids, so each shard's
+    ids are shifted to stay in metadata order.
+    """
+    merged = faiss.read_index(shard_paths[0])
+    is_ivf = faiss.try_extract_index_ivf(merged) is not None
+    for path in shard_paths[1:]:
+        shard = faiss.read_index(path)
+        try:
+            if is_ivf:
+                merged.merge_from(shard, merged.ntotal)
+            else:
+                merged.merge_from(shard)
+        except RuntimeError as e:
+            raise ValueError(f"This index type cannot be merged; use --mode shards instead. ({e})") from e
+        del shard
+    return merged
+
+
+def shard_path(index_path, shard_id):
+    return f"{os.path.splitext(index_path)[0]}.shard{shard_id:03d}.bin"
+
+
+def build_sharded_index(
+    embeddings_path="data/embeddings.npy",
+    index_path="data/faiss_index.bin",
+    index_type="Flat",
+    mode="merge",
+    workers=BUILD_WORKERS,
+    memory_mb=BUILD_MEMORY_MB,
+    train_sample=TRAIN_SAMPLE,
+):
+    """
+    Builds the index for a (possibly larger than RAM) embeddings file.
+    Peak memory: memory_mb for training and the parallel phase; "merge" then
+    also holds the final index (the size /ask will serve) plus one shard.
+    - mode "merge":  writes one index to index_path (same as build_faiss_index)
+    - mode "shards": writes index_path's shard files + a .shards.json manifest;
+      rag.query_faiss.read_index loads them as one faiss.IndexShards
+    Returns a summary dict (shards, rows per shard, written files, build time).
+    """
+    if mode not in SHARD_MODES:
+        raise ValueError(f"Unknown shard mode: {mode} (expected one of {SHARD_MODES})")
+
+    start_time = time.perf_counter()
+    codes, params = open_embeddings(embeddings_path)
+    n, dim = codes.shape
+
+    # The training sample is held (float32 + copy) before the workers start: keep it in budget too
+    train_sample = min(train_sample, max(int(memory_mb * 1024 * 1024 / (dim * 4 * 2)), 1))
+    template = train_template(codes, params, index_type, train_sample)
+    vector_bytes = bytes_per_vector(template, codes, params)
+    shard_rows, chunk_rows = plan_shards(n, dim, vector_bytes, workers, memory_mb)
+    ranges = [(s, min(s + shard_rows, n)) for s in range(0, n, shard_rows)]
+    print(
+        f"Building {len(ranges)} shard(s) of up to {shard_rows} vectors with {workers} worker(s) "
+        f"(~{vector_bytes:.0f} B/vector, {chunk_rows} vectors per add, budget {memory_mb:g} MB)"
+    )
+
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="faiss-shards-", dir=os.path.dirname(index_path) or ".")
+    try:
+        template_path = os.path.join(work_dir, "template.bin")
+        faiss.write_index(template, template_path)
+        del template
+
+        part_paths = [os.path.join(work_dir, f"part{i:03d}.bin") for i in range(len(ranges))]
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(build_shard, embeddings_path, s, e, template_path, path, chunk_rows, threads)
+                for (s, e), path in zip(ranges, part_paths)
+            ]
+            counts = [f.result() for f in futures]
+        for i, count in enumerate(counts):
+            print(f"  shard {i}: {count} vectors")
+
+        if mode == "merge":
+            merged = merge_shards(part_paths)
+            faiss.write_index(merged, index_path)
+            written = [index_path]
+        else:
+            written = []
+            for i, path in enumerate(part_paths):
+                shutil.move(path, shard_path(index_path, i))
+                written.append(shard_path(index_path, i))
+
+            manifest_path = shard_manifest_path(index_path)
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "index_type": index_type,
+                    "dim": dim,
+                    "ntotal": int(sum(counts)),
+                    "shards": [
+                        {"path": os.path.basename(p), "ntotal": int(c)} for p, c in zip(written, counts)
+                    ],
+                }, f, indent=2)
+            written.append(manifest_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Only one layout may exist next to the metadata (read_index prefers the single file)
+    stale = shard_manifest_path(index_path) if mode == "merge" else index_path
+    if os.path.exists(stale):
+        os.remove(stale)
+
+    summary = {
+        "mode": mode,
+        "index_type": index_type,
+        "vectors": int(sum(counts)),
+        "shards": len(ranges),
+        "shard_rows": shard_rows,
+        "chunk_rows": chunk_rows,
+        "bytes_per_vector": vector_bytes,
+        "files": written,
+        "build_s": time.perf_counter() - start_time,
+    }
+    print(f"FAISS index ({index_type}, {mode}) built with {summary['vectors']} vectors in {summary['build_s']:.1f}s.")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a FAISS index in parallel shards with bounded memory.")
+    parser.add_argument("--embeddings", default="data/embeddings.npy")
+    parser.add_argument("--output", default="data/faiss_index.bin")
+    parser.add_argument("--index", default=os.getenv("FAISS_INDEX_TYPE", "Flat"), help="faiss.index_factory spec")
+    parser.add_argument("--mode", choices=SHARD_MODES, default="merge")
+    parser.add_argument("--workers", type=int, default=BUILD_WORKERS)
+    parser.add_argument("--memory-mb", type=float, default=BUILD_MEMORY_MB,
+                        help="Memory budget for training + the parallel build phase (all workers).")
+    parser.add_argument("--train-sample", type=int, default=TRAIN_SAMPLE)
+    args = parser.parse_args()
+
+    build_sharded_index(
+        args.embeddings, args.output, args.index, args.mode,
+        workers=args.workers, memory_mb=args.memory_mb, train_sample=args.train_sample,
+    )
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../src')))
+from eval_rag import build_index, corpus_texts, evaluate_index, ranking_metrics, relevance
+
+
+METADATA = [
+    {"text": "MapReduce has a map phase", "title": "Lecture 5", "source": "5.pdf"},
+    {"text": "Virtualization uses a hypervisor", "title": "Lecture 2", "source": "2.pdf"},
+    {"text": "The reduce phase aggregates values", "title": "Lecture 5", "source": "5.pdf"},
+    {"text": "IAM roles grant permissions", "title": "Lecture 7", "source": "7.pdf"},
+]
+CASES = [
+    {"query": "map reduce", "gold": ["map phase", "reduce phase"]},
+    {"query": "hypervisor", "gold": ["hypervisor"]},
+    {"query": "iam", "gold": ["iam roles"]},
+]
+
+
+def test_relevance_and_metrics_from_one_result_matrix():
+    indices = np.array([
+        [2, 1, 0],   # both golds, at ranks 0 and 2
+        [3, 1, 0],   # gold at rank 1
+        [0, 1, 2],   # gold not retrieved
+    ])
+    rel, gold_rank, n_relevant = relevance(CASES, indices, corpus_texts(METADATA))
+
+    assert rel.tolist() == [[True, False, True], [False, True, False], [False, False, False]]
+    assert gold_rank.tolist() == [[2, 0], [1, -1], [3, -1]]
+    assert n_relevant.tolist() == [2, 1, 1]
+
+    m = ranking_metrics(rel, gold_rank, n_relevant, ks=[1, 3])
+
+    assert m[1]["hit"] == pytest.approx(1 / 3)
+    assert m[3]["hit"] == pytest.approx(2 / 3)
+    assert m[1]["precision"] == pytest.approx(1 / 3)
+    assert m[3]["precision"] == pytest.approx((2 / 3 + 1 / 3) / 3)
+    assert m[1]["recall"] == pytest.approx(0.5 / 3)
+    assert m[3]["recall"] == pytest.approx(2 / 3)
+    assert m[3]["mrr"] == pytest.approx((1 + 0.5) / 3)
+
+    ndcg_q0 = (1 + 1 / np.log2(4)) / (1 + 1 / np.log2(3))
+    ndcg_q1 = (1 / np.log2(3)) / 1.0
+    assert m[3]["ndcg"] == pytest.approx((ndcg_q0 + ndcg_q1) / 3)
+
+
+def test_evaluate_index_searches_once_at_max_k():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((len(METADATA), 16)).astype(np.float32)
+    index = build_index("Flat", embeddings)
+
+    # Query vectors equal to the relevant chunk → perfect ranking at k=1
+    query_vecs = embeddings[[0, 1, 3]]
+    result = evaluate_index(index, query_vecs, CASES, corpus_texts(METADATA), ks=[1, 2, 4])
+
+    assert result["indices"].shape == (3, 4)
+    assert result["metrics"][1]["hit"] == 1.0
+    assert result["metrics"][1]["mrr"] == 1.0
+    assert result["metrics"][4]["recall"] == 1.0
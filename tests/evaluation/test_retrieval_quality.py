@@ -4,29 +4,40 @@ import os
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../src')))
-from embed_faiss import retrieve_top_k  # retrieval function (e.g.: query → top k chunks)
 
 K = 3  # how many top-k passages to return
+GOLD_PATH = "tests/evaluation/gold_passages.json"
+INDEX_PATH = "data/faiss_index.bin"
 
-def load_gold_passages(path="tests/evaluation/gold_passages.json"):
+if not (os.path.exists(GOLD_PATH) and os.path.exists(INDEX_PATH) and os.getenv("GEMINI_API_KEY")):
+    pytest.skip("needs gold_passages.json, a built FAISS index and GEMINI_API_KEY", allow_module_level=True)
+
+from eval_rag import corpus_texts, load_cases, relevance  # noqa: E402
+from rag.query_faiss import FAISSQuery, embed_texts  # noqa: E402
+
+
+def load_gold_passages(path=GOLD_PATH):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def hit_at_k(retrieved, gold_passages):
-    """Check if any gold passage is in retrieved results."""
-    for gold in gold_passages:
-        if any(gold.lower() in r.lower() for r in retrieved):
-            return 1
-    return 0
 
-@pytest.mark.parametrize("sample", load_gold_passages())
-def test_retrieval_quality(sample):
-    query = sample["query"]
-    gold_passages = sample["gold_passages"]
+@pytest.fixture(scope="module")
+def retrieval():
+    """All gold queries embedded in batches and searched once (not one API call per test)."""
+    cases = load_cases(GOLD_PATH)
+    faiss_query = FAISSQuery(index_path=INDEX_PATH)
+    query_vecs = embed_texts([c["query"] for c in cases])
+    _, indices = faiss_query.index.search(query_vecs, K)
+    rel, _, _ = relevance(cases, indices, corpus_texts(faiss_query.metadata))
+    return faiss_query, indices, rel
+
 
-    retrieved = retrieve_top_k(query, k=K)  # my retrieval function should return chunks (text)
-    retrieved_texts = [r for r in retrieved]
+@pytest.mark.parametrize("position,sample", list(enumerate(load_gold_passages())))
+def test_retrieval_quality(retrieval, position, sample):
+    faiss_query, indices, rel = retrieval
+    retrieved_texts = [faiss_query.metadata[i]["text"] for i in indices[position] if i >= 0]
 
     # Evaluate hit@K
-    hit = hit_at_k(retrieved_texts, gold_passages)
-    assert hit == 1, f"Query failed: {query}\nExpected one of {gold_passages}\nGot {retrieved_texts}"
+    assert rel[position].any(), (
+        f"Query failed: {sample['query']}\nExpected one of {sample['gold_passages']}\nGot {retrieved_texts}"
+    )
@@ -0,0 +1,191 @@
+"""
+Local stand-in for the Gemini embedding + generation REST API.
+
+Lets us load-test rag/app.py without spending quota and with a known,
+controllable upstream: every response is delayed by a configurable latency
+and a configurable fraction of requests fail.
+
+Run the fake:
+    python tests/performance/fake_gemini.py --port 8001 \
+        --embed-latency-ms 40 --generate-latency-ms 1500 --error-rate 0.02
+
+Build a synthetic index whose vectors match the fake embeddings:
+    python tests/performance/fake_gemini.py --write-index data/loadtest --num-chunks 2000
+
+Point the app at it:
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8001 SKIP_GCS_DOWNLOAD=1 \
+    LOCAL_INDEX_PATH=data/loadtest/faiss_index.bin \
+    LOCAL_METADATA_PATH=data/loadtest/faiss_metadata.json \
+    uvicorn rag.app:app --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+EMBED_DIM = 768  # same as models/text-embedding-004
+
+
+class FakeConfig:
+    embed_latency_ms: float = 40.0
+    generate_latency_ms: float = 1500.0
+    jitter: float = 0.3          # latency * uniform(1 - jitter, 1 + jitter)
+    error_rate: float = 0.0      # fraction of requests answered with error_status
+    error_status: int = 503
+    answer_words: int = 250
+
+
+config = FakeConfig()
+app = FastAPI(title="Fake Gemini API")
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> np.ndarray:
+    """Deterministic unit vector derived from the text (same text → same vector)."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+async def simulate_upstream(latency_ms: float) -> JSONResponse | None:
+    """Sleeps for the configured latency; returns an error response for a fraction of calls."""
+    factor = random.uniform(1 - config.jitter, 1 + config.jitter)
+    await asyncio.sleep(max(latency_ms * factor, 0.0) / 1000.0)
+
+    if random.random() < config.error_rate:
+        return JSONResponse(
+            status_code=config.error_status,
+            content={
+                "error": {
+                    "code": config.error_status,
+                    "message": "Injected error from fake Gemini.",
+                    "status": "UNAVAILABLE",
+                }
+            },
+        )
+    return None
+
+
+def content_text(content: dict) -> str:
+    return " ".join(p.get("text", "") for p in content.get("parts", []))
+
+
+@app.post("/v1beta/models/{model}:embedContent")
+async def embed_content(model: str, request: Request):
+    error = await simulate_upstream(config.embed_latency_ms)
+    if error is not None:
+        return error
+
+    body = await request.json()
+    vec = fake_embedding(content_text(body.get("content", {})))
+    return {"embedding": {"values": vec.tolist()}}
+
+
+@app.post("/v1beta/models/{model}:batchEmbedContents")
+async def batch_embed_contents(model: str, request: Request):
+    error = await simulate_upstream(config.embed_latency_ms)
+    if error is not None:
+        return error
+
+    body = await request.json()
+    return {
+        "embeddings": [
+            {"values": fake_embedding(content_text(r.get("content", {}))).tolist()}
+            for r in body.get("requests", [])
+        ]
+    }
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    error = await simulate_upstream(config.generate_latency_ms)
+    if error is not None:
+        return error
+
+    body = await request.json()
+    prompt_chars = sum(len(content_text(c)) for c in body.get("contents", []))
+    text = " ".join(["lorem"] * config.answer_words)
+    return {
+        "candidates": [
+            {
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }
+        ],
+        "usageMetadata": {
+            "promptTokenCount": prompt_chars // 4,
+            "candidatesTokenCount": config.answer_words,
+            "totalTokenCount": prompt_chars // 4 + config.answer_words,
+        },
+    }
+
+
+def write_synthetic_index(out_dir: str, num_chunks: int) -> None:
+    """
+    Writes faiss_index.bin + faiss_metadata.json with fake embeddings,
+    so questions embedded by the fake server search a realistic-size index.
+    """
+    import faiss
+
+    os.makedirs(out_dir, exist_ok=True)
+    texts = [f"Synthetic lecture chunk {i} about cloud computing topic {i % 50}." for i in range(num_chunks)]
+    embeddings = np.vstack([fake_embedding(t) for t in texts])
+
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    faiss.write_index(index, os.path.join(out_dir, "faiss_index.bin"))
+
+    metadata = [
+        {
+            "id": f"synthetic_c{i}",
+            "text": t,
+            "source": "synthetic.pdf",
+            "page": i // 5 + 1,
+            "title": f"Topic {i % 50}",
+        }
+        for i, t in enumerate(texts)
+    ]
+    with open(os.path.join(out_dir, "faiss_metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+
+    print(f"Synthetic index with {index.ntotal} vectors written to {out_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini API for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--embed-latency-ms", type=float, default=config.embed_latency_ms)
+    parser.add_argument("--generate-latency-ms", type=float, default=config.generate_latency_ms)
+    parser.add_argument("--jitter", type=float, default=config.jitter)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--error-status", type=int, default=config.error_status)
+    parser.add_argument("--answer-words", type=int, default=config.answer_words)
+    parser.add_argument("--write-index", metavar="DIR", help="Write a synthetic index to DIR and exit.")
+    parser.add_argument("--num-chunks", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.write_index:
+        write_synthetic_index(args.write_index, args.num_chunks)
+        return
+
+    config.embed_latency_ms = args.embed_latency_ms
+    config.generate_latency_ms = args.generate_latency_ms
+    config.jitter = args.jitter
+    config.error_rate = args.error_rate
+    config.error_status = args.error_status
+    config.answer_words = args.answer_words
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
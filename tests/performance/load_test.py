@@ -0,0 +1,215 @@
+"""
+Concurrency load test for the /ask endpoint.
+
+Two load models:
+- closed loop: N virtual students, each sends the next question as soon as
+  the previous answer arrives (measures capacity at fixed concurrency).
+- open loop: requests arrive as a Poisson process at a fixed rate,
+  independent of how fast the server answers (measures queueing / tail
+  latency under a given traffic level). Latency is measured from the
+  scheduled arrival time, so slow responses are not hidden.
+
+For every level the report shows throughput, latency percentiles and
+error rate, so you can see where one instance saturates.
+
+Examples:
+    python tests/performance/load_test.py --mode closed --concurrency 1,2,4,8,16 --duration 20
+    python tests/performance/load_test.py --mode open --rates 1,2,5,10 --duration 30 --output data/load.json
+
+See tests/performance/fake_gemini.py to run the app against a local Gemini stand-in.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import requests
+
+DEFAULT_QUESTIONS = [
+    "What is virtualization?",
+    "How does Map-Reduce work step by step?",
+    "What is the difference between IaaS, PaaS and SaaS?",
+    "Explain how auto-scaling operates.",
+    "What are AWS IAM roles?",
+    "How does two-phase commit work?",
+    "What is a hypervisor?",
+    "Summarize the lecture on cloud storage.",
+]
+
+
+@dataclass
+class Sample:
+    start: float        # seconds since level start (scheduled time for open loop)
+    latency: float      # seconds
+    ok: bool
+    status: int | None  # HTTP status, None on connection error / timeout
+
+
+@dataclass
+class LevelResult:
+    mode: str
+    level: float        # concurrency (closed) or arrival rate in req/s (open)
+    duration: float
+    samples: list[Sample] = field(default_factory=list)
+
+
+def send_request(session: requests.Session, url: str, question: str, top_k: int, timeout: float) -> tuple[bool, int | None]:
+    try:
+        r = session.post(url, json={"question": question, "top_k": top_k}, timeout=timeout)
+        return r.status_code == 200, r.status_code
+    except requests.RequestException:
+        return False, None
+
+
+def run_closed_loop(url, questions, concurrency, duration, top_k, timeout) -> LevelResult:
+    result = LevelResult(mode="closed", level=concurrency, duration=duration)
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+    deadline = t0 + duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            ok, status = send_request(session, url, random.choice(questions), top_k, timeout)
+            sample = Sample(start - t0, time.perf_counter() - start, ok, status)
+            with lock:
+                result.samples.append(sample)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # In-flight requests finish after the deadline; count throughput over the real elapsed time.
+    result.duration = time.perf_counter() - t0
+    return result
+
+
+def run_open_loop(url, questions, rate, duration, top_k, timeout, max_inflight) -> LevelResult:
+    result = LevelResult(mode="open", level=rate, duration=duration)
+    lock = threading.Lock()
+    local = threading.local()
+
+    def fire(scheduled: float, t0: float):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        ok, status = send_request(local.session, url, random.choice(questions), top_k, timeout)
+        sample = Sample(scheduled - t0, time.perf_counter() - scheduled, ok, status)
+        with lock:
+            result.samples.append(sample)
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        t0 = time.perf_counter()
+        next_arrival = t0
+        while True:
+            next_arrival += random.expovariate(rate)
+            if next_arrival - t0 >= duration:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, next_arrival, t0)
+
+    result.duration = max(duration, time.perf_counter() - t0)
+    return result
+
+
+def summarize(result: LevelResult, warmup: float = 0.0) -> dict:
+    """Aggregates samples of one level; samples started during warmup are ignored."""
+    samples = [s for s in result.samples if s.start >= warmup]
+    window = max(result.duration - warmup, 1e-9)
+
+    total = len(samples)
+    errors = sum(1 for s in samples if not s.ok)
+    latencies = np.array([s.latency for s in samples if s.ok], dtype=np.float64) * 1000.0
+
+    def pct(q):
+        return float(np.percentile(latencies, q)) if latencies.size else None
+
+    return {
+        "mode": result.mode,
+        "level": result.level,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_rps": (total - errors) / window,
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": float(latencies.max()) if latencies.size else None,
+        "status_codes": {
+            str(code): sum(1 for s in samples if s.status == code)
+            for code in sorted({s.status for s in samples}, key=lambda c: (c is None, c))
+        },
+    }
+
+
+def print_report(rows: list[dict]) -> None:
+    def fmt(v):
+        return "-" if v is None else f"{v:.0f}"
+
+    label = "conc" if rows and rows[0]["mode"] == "closed" else "rate"
+    print(f"\n{label:>6} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'max':>7}  (latency in ms)")
+    for r in rows:
+        print(
+            f"{r['level']:>6g} {r['requests']:>6} {r['throughput_rps']:>7.2f} {r['error_rate'] * 100:>6.1f} "
+            f"{fmt(r['p50_ms']):>7} {fmt(r['p90_ms']):>7} {fmt(r['p95_ms']):>7} {fmt(r['p99_ms']):>7} {fmt(r['max_ms']):>7}"
+        )
+
+
+def parse_levels(raw: str, cast):
+    return [cast(x) for x in raw.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RAG /ask endpoint.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/ask")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Closed loop: comma-separated concurrency levels.")
+    parser.add_argument("--rates", default="1,2,4,8", help="Open loop: comma-separated arrival rates (req/s).")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level.")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds at the start of each level excluded from stats.")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open loop: client-side cap on concurrent requests.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--questions", help="JSON file with a list of questions.")
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = json.load(f)
+
+    url = args.url.rstrip("/") + args.path
+    rows = []
+
+    if args.mode == "closed":
+        for c in parse_levels(args.concurrency, int):
+            print(f"[closed] concurrency={c} for {args.duration:.0f}s ...")
+            res = run_closed_loop(url, questions, c, args.duration, args.top_k, args.timeout)
+            rows.append(summarize(res, args.warmup))
+    else:
+        for rate in parse_levels(args.rates, float):
+            print(f"[open] rate={rate} req/s for {args.duration:.0f}s ...")
+            res = run_open_loop(url, questions, rate, args.duration, args.top_k, args.timeout, args.max_inflight)
+            rows.append(summarize(res, args.warmup))
+
+    print_report(rows)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
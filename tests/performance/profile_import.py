@@ -0,0 +1,87 @@
+"""
+Import-time profile of the API module (what a Cloud Run cold start pays
+before uvicorn can answer /health).
+
+Runs `python -X importtime -c "import rag.app"` in a fresh interpreter
+without GEMINI_API_KEY and reports the slowest imports.
+
+    python tests/performance/profile_import.py --top 15
+    python tests/performance/profile_import.py --budget-ms 1500 --output data/import_profile.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Must only be imported when first used (index load / first Gemini call)
+LAZY_MODULES = ("faiss", "google.generativeai", "google.cloud.storage", "torch", "sentence_transformers")
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def profile_import(module="rag.app"):
+    """Returns (rows, loaded_lazy_modules); rows are sorted by cumulative time."""
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            rows.append({
+                "module": m.group(4),
+                "self_ms": int(m.group(1)) / 1000.0,
+                "cumulative_ms": int(m.group(2)) / 1000.0,
+                "depth": len(m.group(3)) // 2,
+            })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return rows, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of rag.app")
+    parser.add_argument("--module", default="rag.app")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, help="Exit with an error if the import takes longer.")
+    parser.add_argument("--output", help="Write the full profile as JSON.")
+    args = parser.parse_args()
+
+    rows, loaded = profile_import(args.module)
+    total = next(r["cumulative_ms"] for r in rows if r["module"] == args.module)
+
+    print(f"import {args.module}: {total:.0f} ms\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for r in rows[:args.top]:
+        print(f"{r['cumulative_ms']:>14.1f} {r['self_ms']:>9.1f}  {'  ' * r['depth']}{r['module']}")
+
+    if loaded:
+        print(f"\n[WARN] Heavy modules imported eagerly: {', '.join(loaded)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"module": args.module, "total_ms": total, "eager_heavy": loaded, "imports": rows}, f, indent=2)
+        print(f"\nProfile saved to {args.output}")
+
+    if loaded or (args.budget_ms is not None and total > args.budget_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
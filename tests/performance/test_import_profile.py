@@ -0,0 +1,10 @@
+from profile_import import LAZY_MODULES, profile_import
+
+
+def test_app_imports_without_api_key_or_heavy_modules():
+    rows, loaded = profile_import("rag.app")
+
+    assert loaded == [], f"imported at module load: {loaded}"
+    imported = {r["module"] for r in rows}
+    assert "rag.app" in imported
+    assert not imported & set(LAZY_MODULES)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from fake_gemini import fake_embedding
+from load_test import LevelResult, Sample, summarize
+
+
+def test_fake_embedding_is_deterministic_unit_vector():
+    a = fake_embedding("What is virtualization?")
+    b = fake_embedding("What is virtualization?")
+    c = fake_embedding("What is a hypervisor?")
+
+    assert a.shape == (768,)
+    assert np.allclose(a, b)
+    assert not np.allclose(a, c)
+    assert abs(float(np.linalg.norm(a)) - 1.0) < 1e-5
+
+
+def test_summarize_excludes_warmup_and_counts_errors():
+    result = LevelResult(mode="closed", level=2, duration=11.0)
+    result.samples = [Sample(0.5, 5.0, True, 200)]  # warmup, ignored
+    result.samples += [Sample(1.0 + i * 0.1, 0.1 * (i + 1), True, 200) for i in range(8)]
+    result.samples += [Sample(5.0, 0.2, False, 503), Sample(6.0, 30.0, False, None)]
+
+    row = summarize(result, warmup=1.0)
+
+    assert row["requests"] == 10
+    assert row["errors"] == 2
+    assert row["error_rate"] == 0.2
+    assert row["throughput_rps"] == 8 / 10.0
+    assert row["max_ms"] == 800.0
+    assert row["p50_ms"] == 450.0
+    assert row["status_codes"] == {"200": 8, "503": 1, "None": 1}
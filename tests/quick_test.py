@@ -1,6 +1,6 @@
 import requests
 
-url = "http://localhost:8000/rag/ask"
+url = "http://localhost:8000/ask"
 data = {
     "question": "How do I wear the Gear VR headset?",
     "top_k": 3
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import rag.app as app_module
+from rag.collection_store import CollectionStore
+from rag.query_log import QueryLog
+from rag.resilience import CircuitOpenError, UpstreamError, UpstreamTimeoutError
+
+
+class FakeIndex:
+    ntotal = 3
+
+
+class FakeCollection:
+    memory_bytes = 100
+    index = FakeIndex()
+
+
+@pytest.fixture(autouse=True)
+def local_query_log(monkeypatch, tmp_path):
+    """Keeps the query log of app tests in a temp file (never GCS)."""
+    query_log = QueryLog(path=str(tmp_path / "query_log.json"), gcs_path=None)
+    monkeypatch.setattr(app_module, "query_log", query_log)
+    return query_log
+
+
+@pytest.fixture
+def slow_store(monkeypatch):
+    """Collection store whose loader blocks until the test releases it."""
+    release = threading.Event()
+
+    def loader(collection_id):
+        release.wait(timeout=5)
+        return FakeCollection()
+
+    store = CollectionStore(loader=loader, pinned=app_module.PINNED_COLLECTIONS)
+    monkeypatch.setattr(app_module, "collection_store", store)
+    return store, release
+
+
+def test_health_answers_before_index_is_loaded(slow_store):
+    store, release = slow_store
+
+    with TestClient(app_module.app) as client:
+        assert client.get("/health").json() == {"status": "ok"}
+
+        ready = client.get("/ready")
+        assert ready.status_code == 503
+        assert ready.json()["status"] == "loading"
+
+        release.set()
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.01)
+
+        assert client.get("/ready").json()["status"] == "ready"
+
+
+class AnsweringCollection(FakeCollection):
+    def query(self, text, top_k=5):
+        return [{"text": "MapReduce splits work.", "source": "w1.pdf", "page": 1, "title": "W1", "distance": 0.1}]
+
+
+@pytest.mark.parametrize(
+    "error, status",
+    [
+        (UpstreamTimeoutError("generate: no response"), 504),
+        (CircuitOpenError("generate: circuit open", retry_after=12.5), 503),
+        (UpstreamError("generate: HTTP 500"), 503),
+    ],
+)
+def test_ask_maps_gemini_failures_to_http_errors(monkeypatch, error, status):
+    store = CollectionStore(loader=lambda cid: AnsweringCollection(), pinned=())
+    monkeypatch.setattr(app_module, "collection_store", store)
+
+    def failing_generate(question, passages):
+        raise error
+
+    monkeypatch.setattr(app_module, "generate_answer", failing_generate)
+
+    response = TestClient(app_module.app).post("/ask", json={"question": "What is MapReduce?"})
+
+    assert response.status_code == status
+    assert "detail" in response.json()
+    if isinstance(error, CircuitOpenError):
+        assert response.headers["Retry-After"] == "13"
+
+
+def test_ingestion_routes_are_not_registered_without_a_key():
+    client = TestClient(app_module.app)  # INGEST_API_KEY is unset in tests
+
+    assert client.get("/jobs").status_code == 404
+    assert client.post("/collections/cs101/documents", files={"files": ("a.txt", b"x")}).status_code == 404
+
+
+class StubIngestManager:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, collection_id, uploaded):
+        self.submitted.append((collection_id, uploaded))
+        return SimpleNamespace(to_dict=lambda: {"id": "job1", "collection": collection_id})
+
+    def list(self):
+        return []
+
+
+@pytest.fixture
+def ingest_client(monkeypatch):
+    """Ingestion routes mounted as on a deployment with INGEST_API_KEY=s3cret."""
+    monkeypatch.setattr(app_module, "INGEST_API_KEY", "s3cret")
+    monkeypatch.setattr(app_module, "INGEST_MAX_UPLOAD_MB", 0.01)  # ~10 KB
+    manager = StubIngestManager()
+    monkeypatch.setattr(app_module, "ingest_manager", manager)
+
+    ingest_app = FastAPI()
+    ingest_app.include_router(app_module.ingest_router)
+    return ingest_app, TestClient(ingest_app), manager
+
+
+def test_ingestion_endpoints_require_the_api_key(ingest_client):
+    _, client, manager = ingest_client
+    upload = ("/collections/cs101/documents", {"files": ("a.txt", b"x")})
+
+    assert client.get("/jobs").status_code == 401
+    assert client.get("/jobs/abc", headers={"X-API-Key": "wrong"}).status_code == 401
+    assert client.post(upload[0], files=upload[1], headers={"X-API-Key": "wrong"}).status_code == 401
+    assert client.get("/jobs", headers={"X-API-Key": "s3cret"}).status_code == 200
+
+    response = client.post(upload[0], files=upload[1], headers={"X-API-Key": "s3cret"})
+    assert response.status_code == 202
+    assert manager.submitted == [("cs101", {"a.txt": b"x"})]
+
+
+def post_raw(app, path, headers, chunks):
+    """Sends a request straight to the ASGI app; returns (status, body chunks the app read)."""
+    chunks = list(chunks)
+    read = []
+    sent = []
+
+    async def receive():
+        if not chunks:
+            return {"type": "http.disconnect"}
+        read.append(chunks.pop(0))
+        return {"type": "http.request", "body": read[-1], "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    return next(m["status"] for m in sent if m["type"] == "http.response.start"), len(read)
+
+
+def test_oversized_or_unauthenticated_uploads_are_rejected_before_reading_the_body(ingest_client):
+    app, _, _ = ingest_client
+    path = "/collections/cs101/documents"
+    multipart = {"content-type": "multipart/form-data; boundary=xyz"}
+    part = b'--xyz\r\nContent-Disposition: form-data; name="files"; filename="a.txt"\r\n\r\n'
+    body = [part] + [b"x" * 64 * 1024] * 100  # 6.4 MB
+
+    assert post_raw(app, path, {**multipart, "content-length": "6553600"}, body) == (401, 0)
+    assert post_raw(app, path, {**multipart, "content-length": "6553600", "x-api-key": "s3cret"}, body) == (413, 0)
+
+    # Chunked upload without Content-Length: cut off once the limit is passed
+    status, read = post_raw(app, path, {**multipart, "x-api-key": "s3cret"}, body)
+    assert status == 413
+    assert read <= 4
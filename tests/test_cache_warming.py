@@ -0,0 +1,205 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+import rag.gemini_client as gemini_client
+import rag.query_faiss as query_faiss
+import rag.query_log as query_log_module
+from rag.cache_warming import CacheWarmer, warm_collection
+from rag.query_faiss import FAISSQuery, embedding_cache, retrieval_cache
+from rag.query_log import QueryLog
+from rag.resilience import UpstreamError
+
+DIM = 8
+
+
+def fake_embed(texts):
+    """Deterministic vector per question (the first DIM bytes of its text)."""
+    out = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        codes = [ord(c) % 7 for c in text[:DIM]]
+        out[row, :len(codes)] = codes
+    return out
+
+
+def no_gemini(*args, **kwargs):
+    raise AssertionError("warmed questions must not call Gemini")
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    embedding_cache.clear()
+    retrieval_cache.clear()
+    yield
+    embedding_cache.clear()
+    retrieval_cache.clear()
+
+
+def write_collection(path, n=50):
+    vectors = np.random.default_rng(0).integers(0, 7, size=(n, DIM)).astype(np.float32)
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors)
+    faiss.write_index(index, str(path / "faiss_index.bin"))
+    with open(path / "faiss_metadata.json", "w", encoding="utf-8") as f:
+        json.dump([{"text": f"passage {i}", "source": "w1.pdf", "page": i, "title": "W1"} for i in range(n)], f)
+    return str(path / "faiss_index.bin"), str(path / "faiss_metadata.json")
+
+
+@pytest.fixture
+def collection(tmp_path):
+    return FAISSQuery(*write_collection(tmp_path))
+
+
+# --------------------------
+# Query log
+# --------------------------
+def test_query_log_ranks_normalized_questions_per_collection(tmp_path):
+    log = QueryLog(path=str(tmp_path / "log.json"), gcs_path=None)
+    for q in ["What is RAID?", "what  is RAID? ", "What is RAID?", "What is NFS?"]:
+        log.record("os", q)
+    log.record("db", "What is 2PC?")
+
+    assert log.top("os", 5) == ["What is RAID?", "What is NFS?", "what is RAID?"]
+    assert log.top("db", 5) == ["What is 2PC?"]
+
+
+def test_query_log_flush_adds_up_across_instances_and_compacts(tmp_path):
+    path = str(tmp_path / "log.json")
+    first, second = QueryLog(path, gcs_path=None, max_entries=2), QueryLog(path, gcs_path=None, max_entries=2)
+
+    for _ in range(3):
+        first.record("os", "What is RAID?")
+    first.record("os", "What is NFS?")
+    first.flush()
+
+    second.record("os", "What is RAID?")
+    second.record("os", "What is a page fault?")
+    second.record("os", "What is a page fault?")
+    second.flush()
+
+    restarted = QueryLog(path, gcs_path=None)
+    assert restarted.load() == 2
+    assert restarted.top("os", 5) == ["What is RAID?", "What is a page fault?"]
+
+
+class PreconditionFailed(Exception):
+    code = 412
+
+
+class FakeGCSObject:
+    """One GCS object with generations; before_next_download runs once, mid-flush."""
+
+    def __init__(self):
+        self.content = None
+        self.generation = 0
+        self.before_next_download = None
+
+    def download(self, gcs_path, local_path, bucket_name=None):
+        if self.generation == 0:
+            return 0
+        generation = self.generation
+        with open(local_path, "wb") as f:
+            f.write(self.content)
+        hook, self.before_next_download = self.before_next_download, None
+        if hook is not None:
+            hook()
+        return generation
+
+    def upload(self, local_path, gcs_path, bucket_name=None, if_generation_match=None):
+        if if_generation_match is not None and if_generation_match != self.generation:
+            raise PreconditionFailed("generation mismatch")
+        with open(local_path, "rb") as f:
+            self.content = f.read()
+        self.generation += 1
+
+
+def test_concurrent_gcs_flushes_add_up(tmp_path, monkeypatch):
+    gcs = FakeGCSObject()
+    monkeypatch.setattr(query_log_module, "download_gcs_generation", gcs.download)
+    monkeypatch.setattr(query_log_module, "upload_file_to_gcs", gcs.upload)
+
+    first = QueryLog(str(tmp_path / "a.json"), gcs_path="logs/query_log.json")
+    second = QueryLog(str(tmp_path / "b.json"), gcs_path="logs/query_log.json")
+    first.record("os", "What is RAID?")
+    first.flush()
+
+    first.record("os", "What is RAID?")
+    second.record("os", "What is RAID?")
+    second.record("os", "What is NFS?")
+    # second saves after first read the log: first's upload is rejected and redone
+    gcs.before_next_download = second.flush
+    first.flush()
+
+    assert gcs.generation == 3
+    assert json.loads(gcs.content)["queries"] == [["os", "What is RAID?", 3], ["os", "What is NFS?", 1]]
+
+
+# --------------------------
+# Warming
+# --------------------------
+def test_warmed_questions_skip_embedding_and_search(collection, monkeypatch):
+    questions = ["What is RAID?", "What is NFS?"]
+
+    result = warm_collection(collection, questions, top_k=10, embed_fn=fake_embed)
+    assert result == {"questions": 2, "embedded": 2, "warmed": 2}
+
+    monkeypatch.setattr(query_faiss, "embed_content", no_gemini)
+    collection.index = None  # a search would fail
+    for q in questions:
+        assert len(collection.query(q, top_k=5)) == 5  # any top_k up to the warmed one
+
+
+def test_warm_results_match_a_normal_query(collection):
+    warm_collection(collection, ["What is RAID?"], top_k=5, embed_fn=fake_embed)
+    warmed = collection.query("What is RAID?", top_k=5)
+
+    retrieval_cache.clear()
+    assert collection.query("What is RAID?", top_k=5) == warmed
+
+
+def test_budget_and_upstream_failures_stop_embedding(collection):
+    assert warm_collection(collection, ["What is RAID?"], budget_s=0, embed_fn=fake_embed)["embedded"] == 0
+
+    def failing_embed(texts):
+        raise UpstreamError("embed: circuit open")
+
+    assert warm_collection(collection, ["What is RAID?"], embed_fn=failing_embed)["warmed"] == 0
+
+
+def test_warming_embeds_through_its_own_caller(collection, monkeypatch):
+    callers = []
+
+    def embed_content(caller=None, **kwargs):
+        callers.append(caller)
+        return {"embedding": fake_embed(kwargs["content"]).tolist()}
+
+    monkeypatch.setattr(query_faiss, "embed_content", embed_content)
+    warm_collection(collection, ["What is RAID?"], top_k=5)
+
+    assert callers == [gemini_client.warm_embed_caller]
+
+
+def test_hot_swapped_collection_is_not_served_stale_results(collection, tmp_path):
+    warm_collection(collection, ["What is RAID?"], top_k=5, embed_fn=fake_embed)
+
+    (tmp_path / "v2").mkdir()
+    swapped = FAISSQuery(*write_collection(tmp_path / "v2", n=3))
+
+    assert len(swapped.query("What is RAID?", top_k=5)) == 3
+
+
+def test_cache_warmer_warms_top_questions_of_the_log(collection, tmp_path):
+    log = QueryLog(path=str(tmp_path / "log.json"), gcs_path=None)
+    for q in ["What is RAID?", "What is RAID?", "What is NFS?", "What is 2PC?"]:
+        log.record("os", q)
+
+    warmer = CacheWarmer(lambda cid: collection, log, top_n=2, top_k=5, embed_fn=fake_embed)
+    result = warmer.schedule("os").result(timeout=5)
+    warmer.shutdown()
+
+    assert result["warmed"] == 2
+    assert embedding_cache.peek("What is RAID?") is not None
+    assert embedding_cache.peek("What is NFS?") is None  # ties: alphabetical, top_n=2
+    assert warmer.schedule("os") is None
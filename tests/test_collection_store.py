@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+
+import rag.collection_store as collection_store
+from rag.collection_store import (
+    CollectionConflictError,
+    CollectionNotFoundError,
+    CollectionStore,
+    InvalidCollectionError,
+)
+
+
+class FakeIndex:
+    ntotal = 10
+
+
+class FakeCollection:
+    def __init__(self, name, memory_bytes):
+        self.name = name
+        self.memory_bytes = memory_bytes
+        self.index = FakeIndex()
+
+
+def make_store(max_bytes=250, pinned=("default",), sizes=None, delay=0.0):
+    calls = []
+
+    def loader(collection_id):
+        calls.append(collection_id)
+        time.sleep(delay)
+        return FakeCollection(collection_id, (sizes or {}).get(collection_id, 100))
+
+    return CollectionStore(loader=loader, max_bytes=max_bytes, pinned=pinned), calls
+
+
+def test_loads_lazily_and_reuses_loaded_collection():
+    store, calls = make_store()
+
+    first = store.get("cs101")
+    second = store.get("cs101")
+
+    assert first is second
+    assert calls == ["cs101"]
+
+
+def test_evicts_least_recently_used_but_never_pinned():
+    store, calls = make_store(max_bytes=250)
+
+    store.get("default")   # pinned
+    store.get("cs101")
+    store.get("cs102")     # 300 bytes > 250 → evict LRU unpinned (cs101)
+
+    assert list(store.loaded()) == ["default", "cs102"]
+
+    store.get("default")
+    store.get("cs103")     # evicts cs102, default stays pinned
+    assert list(store.loaded()) == ["default", "cs103"]
+
+    store.get("cs101")     # reloaded after eviction
+    assert calls.count("cs101") == 2
+
+
+def test_oversized_collection_is_kept_while_in_use():
+    store, _ = make_store(max_bytes=250, pinned=(), sizes={"big": 1000})
+
+    store.get("small")
+    store.get("big")
+
+    assert list(store.loaded()) == ["big"]
+
+
+def test_concurrent_requests_load_a_collection_once():
+    store, calls = make_store(delay=0.05)
+
+    threads = [threading.Thread(target=store.get, args=("cs101",)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["cs101"]
+
+
+def test_load_locks_are_released_after_loading():
+    store, _ = make_store(delay=0.05)
+
+    threads = [threading.Thread(target=store.get, args=(f"cs{i % 3}",)) for i in range(9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert store._load_locks == {}
+
+
+def test_unknown_collections_are_remembered_until_created():
+    calls = []
+
+    def loader(collection_id):
+        calls.append(collection_id)
+        raise CollectionNotFoundError(f"No index for {collection_id}")
+
+    store = CollectionStore(loader=loader, pinned=())
+    for _ in range(3):
+        with pytest.raises(CollectionNotFoundError):
+            store.get("nope")
+    assert calls == ["nope"]
+    assert store._load_locks == {}
+
+    store.put("nope", FakeCollection("nope", 100))  # e.g. created by an ingestion job
+    assert store.get("nope").name == "nope"
+
+    expiring = CollectionStore(loader=loader, pinned=(), missing_ttl_s=0)
+    for _ in range(2):
+        with pytest.raises(CollectionNotFoundError):
+            expiring.get("gone")
+    assert calls.count("gone") == 2
+
+
+def test_refresh_reloads_only_collections_published_elsewhere():
+    store, calls = make_store(max_bytes=1000)
+    store.is_stale = lambda cid, fq: cid == "cs101"
+    old = store.get("cs101")
+    store.get("cs102")
+
+    assert store.refresh() == ["cs101"]
+    assert store.get("cs101") is not old
+    assert calls == ["cs101", "cs102", "cs101"]
+
+
+def test_refresh_does_not_replace_a_version_published_meanwhile():
+    store, _ = make_store()
+    store.get("cs101")
+    ingested = FakeCollection("cs101", 100)
+
+    def stale(cid, fq):
+        store.put(cid, ingested)  # e.g. an ingestion job swapped while the refresh was loading
+        return True
+
+    store.is_stale = stale
+
+    assert store.refresh() == []
+    assert store.get("cs101") is ingested
+
+
+def test_save_collection_reports_a_conflicting_publish(monkeypatch, tmp_path):
+    import faiss
+    import numpy as np
+
+    class PreconditionFailed(Exception):
+        code = 412
+
+    uploads = []
+
+    def upload(local_path, gcs_path, bucket_name=None, if_generation_match=None):
+        uploads.append((gcs_path, if_generation_match))
+        raise PreconditionFailed("generation mismatch")
+
+    monkeypatch.setattr(collection_store, "SKIP_GCS_DOWNLOAD", False)
+    monkeypatch.setattr(collection_store, "upload_file_to_gcs", upload)
+    index = faiss.IndexFlatL2(4)
+    index.add(np.zeros((1, 4), dtype=np.float32))
+
+    with pytest.raises(CollectionConflictError):
+        collection_store.save_collection("cs101", index, [{"text": "a"}], generations={"index": 7, "metadata": 8})
+    assert uploads == [("faiss/cs101/faiss_index.bin", 7)]
+
+
+@pytest.mark.parametrize("bad", ["", "../etc", "a/b", "x" * 65, "-start"])
+def test_rejects_unsafe_collection_ids(bad):
+    store, calls = make_store()
+
+    with pytest.raises(InvalidCollectionError):
+        store.get(bad)
+    assert calls == []
@@ -0,0 +1,209 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import rag.gemini_client as gemini_client
+import rag.ingest_jobs as ingest_jobs
+from rag.collection_store import CollectionConflictError, CollectionNotFoundError, CollectionStore
+from rag.ingest_jobs import IngestJobManager, IngestQueueFullError
+from rag.resilience import CircuitBreaker, ResilientCaller
+
+DIM = 8
+
+
+def fake_parse(path):
+    with open(path, "r", encoding="utf-8") as f:
+        words = f.read().split()
+    name = path.rsplit("/", 1)[-1]
+    return [
+        {"id": f"{name}_c{i}", "text": w, "source": name, "page": 0, "title": "Unknown"}
+        for i, w in enumerate(words)
+    ]
+
+
+def fake_embed(texts):
+    return np.ones((len(texts), DIM), dtype=np.float32)
+
+
+def fake_save(collection_id, index, metadata, generations=None):
+    return SimpleNamespace(index=index, metadata=metadata, memory_bytes=100)
+
+
+def missing_loader(collection_id):
+    raise CollectionNotFoundError(collection_id)
+
+
+def wait_for(manager, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job.status in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def make_manager(store=None, **kwargs):
+    store = store or CollectionStore(loader=missing_loader, pinned=())
+    defaults = dict(embed_fn=fake_embed, parse_fn=fake_parse, save_fn=fake_save, use_processes=False)
+    defaults.update(kwargs)
+    return store, IngestJobManager(store, **defaults)
+
+
+def test_job_creates_collection_and_hot_swaps_it():
+    published = []
+    store, manager = make_manager(on_published=published.append)
+
+    job = manager.submit("cs101", {"notes.txt": b"map reduce shuffle"})
+    job = wait_for(manager, job.id)
+
+    assert job.status == "succeeded"
+    assert job.stage == "done"
+    assert job.chunks_added == 3
+    assert store.get("cs101").index.ntotal == 3
+    assert [m["text"] for m in store.get("cs101").metadata] == ["map", "reduce", "shuffle"]
+    assert published == ["cs101"]
+
+
+def test_job_appends_to_existing_collection_without_touching_live_index():
+    import faiss
+
+    live_index = faiss.IndexFlatL2(DIM)
+    live_index.add(np.zeros((2, DIM), dtype=np.float32))
+    live = SimpleNamespace(index=live_index, metadata=[{"text": "a"}, {"text": "b"}], memory_bytes=100)
+
+    store = CollectionStore(loader=lambda cid: live, pinned=())
+    store, manager = make_manager(store=store)
+
+    job = wait_for(manager, manager.submit("cs101", {"more.txt": b"c d"}).id)
+
+    assert job.status == "succeeded"
+    assert live.index.ntotal == 2
+    assert store.get("cs101").index.ntotal == 4
+    assert len(store.get("cs101").metadata) == 4
+
+
+def test_concurrent_jobs_on_one_collection_keep_every_upload():
+    store, manager = make_manager(workers=2)
+    put = store.put
+
+    def slow_put(collection_id, fq):
+        time.sleep(0.05)  # the next job must not copy the index before the swap
+        put(collection_id, fq)
+
+    store.put = slow_put
+    first = manager.submit("cs101", {"a.txt": b"x"})
+    second = manager.submit("cs101", {"b.txt": b"y z"})
+
+    assert wait_for(manager, first.id).status == "succeeded"
+    assert wait_for(manager, second.id).status == "succeeded"
+    assert store.get("cs101").index.ntotal == 3
+
+
+def test_collection_locks_are_released_after_jobs():
+    _, manager = make_manager(workers=2)
+
+    jobs = [manager.submit(f"cs{i}", {"a.txt": b"x"}) for i in range(5)]
+    for job in jobs:
+        wait_for(manager, job.id)
+    # Released just after the status is set
+    deadline = time.time() + 5
+    while manager._collection_locks and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert manager._collection_locks == {}
+
+
+def test_conflicting_publish_is_redone_on_the_other_instances_version():
+    import faiss
+
+    def version(texts, generation):
+        index = faiss.IndexFlatL2(DIM)
+        index.add(np.zeros((len(texts), DIM), dtype=np.float32))
+        fq = SimpleNamespace(index=index, metadata=[{"text": t} for t in texts], memory_bytes=100)
+        fq.gcs_generations = {"index": generation, "metadata": generation}
+        return fq
+
+    # Loaded here: generation 1; meanwhile another instance published generation 2
+    versions = [version(["a"], 1), version(["a", "other"], 2)]
+    saves = []
+
+    def save(collection_id, index, metadata, generations=None):
+        saves.append(generations)
+        if generations["metadata"] == 1:
+            raise CollectionConflictError("published elsewhere")
+        return fake_save(collection_id, index, metadata)
+
+    store = CollectionStore(loader=lambda cid: versions.pop(0), pinned=())
+    store, manager = make_manager(store=store, save_fn=save)
+
+    job = wait_for(manager, manager.submit("cs101", {"b.txt": b"mine"}).id)
+
+    assert job.status == "succeeded"
+    assert saves == [{"index": 1, "metadata": 1}, {"index": 2, "metadata": 2}]
+    assert [m["text"] for m in store.get("cs101").metadata] == ["a", "other", "mine"]
+
+
+def test_new_collection_is_published_only_if_it_does_not_exist_yet():
+    saves = []
+
+    def save(collection_id, index, metadata, generations=None):
+        saves.append(generations)
+        return fake_save(collection_id, index, metadata)
+
+    _, manager = make_manager(save_fn=save)
+    assert wait_for(manager, manager.submit("cs101", {"a.txt": b"x"}).id).status == "succeeded"
+    assert saves == [{"index": 0, "metadata": 0}]
+
+
+def test_ingestion_embed_failures_do_not_open_the_query_circuit(monkeypatch):
+    class Overloaded(Exception):
+        code = 429
+
+    def embed_content(**kwargs):
+        raise Overloaded("quota exceeded")
+
+    monkeypatch.setattr(gemini_client, "get_genai", lambda: SimpleNamespace(embed_content=embed_content))
+    ingest_caller = ResilientCaller(
+        "ingest_embed", timeout_s=0.2, deadline_s=0.5, max_attempts=2, backoff_base_s=0.01,
+        breaker=CircuitBreaker("ingest_embed", failure_threshold=1),
+    )
+    monkeypatch.setattr(ingest_jobs, "ingest_embed_caller", ingest_caller)
+
+    _, manager = make_manager(embed_fn=None)
+    job = wait_for(manager, manager.submit("cs101", {"a.txt": b"x"}).id)
+
+    assert job.status == "failed"
+    assert ingest_caller.breaker.state == "open"
+    assert gemini_client.embed_caller.breaker.state == "closed"
+
+
+def test_failed_job_reports_error():
+    _, manager = make_manager()
+
+    job = wait_for(manager, manager.submit("cs101", {"empty.txt": b"   "}).id)
+
+    assert job.status == "failed"
+    assert "No text" in job.error
+
+
+def test_queue_limit():
+    release = threading.Event()
+
+    def blocking_parse(path):
+        release.wait(timeout=5)
+        return fake_parse(path)
+
+    _, manager = make_manager(parse_fn=blocking_parse, max_queued=1)
+    first = manager.submit("cs101", {"a.txt": b"x"})     # running (blocked)
+    time.sleep(0.05)
+    manager.submit("cs102", {"b.txt": b"y"})             # queued
+
+    with pytest.raises(IngestQueueFullError):
+        manager.submit("cs103", {"c.txt": b"z"})
+
+    release.set()
+    assert wait_for(manager, first.id).status == "succeeded"
@@ -0,0 +1,46 @@
+from rag.cache import LRUCache
+from rag.metrics import CACHE_HIT_RATIO, STAGE_SECONDS, collect_stage_timings, stage_timer
+
+
+def _histogram_count(stage: str) -> float:
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and sample.labels.get("stage") == stage:
+                return sample.value
+    return 0.0
+
+
+def test_stage_timer_fills_breakdown_and_histogram():
+    before = _histogram_count("test_stage")
+
+    with collect_stage_timings() as timings:
+        with stage_timer("test_stage"):
+            pass
+        with stage_timer("test_stage"):
+            pass
+
+    assert set(timings) == {"test_stage"}
+    assert timings["test_stage"] >= 0.0
+    assert _histogram_count("test_stage") == before + 2
+
+
+def test_stage_timer_outside_request_only_observes_histogram():
+    with stage_timer("test_outside"):
+        pass
+
+    with collect_stage_timings() as timings:
+        pass
+    assert timings == {}
+
+
+def test_lru_cache_evicts_oldest_and_tracks_hit_ratio():
+    cache = LRUCache("test_cache", maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1   # a is now most recent
+    cache.put("c", 3)            # evicts b
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert CACHE_HIT_RATIO.labels(cache="test_cache")._value.get() == 2 / 3
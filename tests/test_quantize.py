@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from src.quantize import (
+    compare,
+    dequantize_embeddings,
+    load_embeddings,
+    quantize_embeddings,
+    save_embeddings,
+)
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((300, 64)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_int8_roundtrip_error_is_within_half_a_step(embeddings):
+    codes, params = quantize_embeddings(embeddings, "int8")
+
+    assert codes.dtype == np.int8
+    assert params.shape == (2, embeddings.shape[1])
+
+    restored = dequantize_embeddings(codes, params)
+    assert np.all(np.abs(restored - embeddings) <= params[1] / 2 + 1e-6)
+
+
+def test_save_and_load_quantized_files(tmp_path, embeddings):
+    base = str(tmp_path / "embeddings.npy")
+
+    f16 = save_embeddings(embeddings, base, "float16")
+    i8 = save_embeddings(embeddings, base, "int8")
+
+    assert f16 == [str(tmp_path / "embeddings.float16.npy")]
+    assert i8 == [str(tmp_path / "embeddings.int8.npy"), str(tmp_path / "embeddings.int8.qparams.npy")]
+    assert np.allclose(load_embeddings(f16[0]), embeddings, atol=1e-3)
+    assert np.allclose(load_embeddings(i8[0]), embeddings, atol=0.05)
+
+
+def test_chunked_save_of_memory_mapped_embeddings_matches_in_memory_quantization(tmp_path, embeddings):
+    base = str(tmp_path / "embeddings.npy")
+    np.save(base, embeddings)
+    mapped = np.load(base, mmap_mode="r")
+
+    path, qparams = save_embeddings(mapped, base, "int8", chunk_rows=7)
+    codes, params = quantize_embeddings(embeddings, "int8")
+
+    assert np.array_equal(np.load(path), codes)
+    assert np.array_equal(np.load(qparams), params)
+
+
+def test_compare_reports_savings_and_recall(embeddings):
+    rows = {r["name"]: r for r in compare(embeddings, index_specs=("SQ8",), k=5, n_queries=50)}
+
+    assert rows["embeddings[float32]"]["recall"] == 1.0
+    assert rows["index[Flat]"]["recall"] == 1.0
+    assert rows["embeddings[float16]"]["saved"] == pytest.approx(0.5)
+    assert rows["embeddings[int8]"]["saved"] > 0.7
+    assert rows["index[SQ8]"]["disk_bytes"] < rows["index[Flat]"]["disk_bytes"] / 3
+    assert rows["index[SQ8]"]["recall"] > 0.8
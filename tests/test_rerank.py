@@ -0,0 +1,190 @@
+from types import SimpleNamespace
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import rag.app as app_module
+from rag.collection_store import CollectionStore
+from rag.rerank import RERANK_MAX_LENGTH, Reranker
+
+QUESTION = "What is a hypervisor?"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCrossEncoder:
+    """Scores = the number in the passage text; each call costs batch_s on the fake clock."""
+
+    def __init__(self, clock, batch_s=0.01):
+        self.clock = clock
+        self.batch_s = batch_s
+        self.calls = 0
+
+    def __call__(self, pairs):
+        self.calls += 1
+        self.clock.now += self.batch_s * len(pairs) / 4
+        return np.array([float(text.split()[-1]) if text[-1].isdigit() else 0.0 for _, text in pairs])
+
+
+def passages(n=12):
+    # FAISS order: passage 0 is the closest, the cross-encoder prefers higher numbers
+    return [{"text": f"passage {i}", "source": "w1.pdf", "page": i, "distance": float(i)} for i in range(n)]
+
+
+def make_reranker(budget_ms=1000, batch_s=0.01, top_n=3):
+    clock = FakeClock()
+    scorer = FakeCrossEncoder(clock, batch_s)
+    reranker = Reranker(lambda: scorer, budget_ms=budget_ms, batch_size=4, top_n=top_n, clock=clock)
+    reranker.load()
+    return reranker, scorer
+
+
+def test_rerank_orders_by_score_and_keeps_top_n():
+    reranker, _ = make_reranker()
+    candidates = passages()
+
+    results = reranker.rerank(QUESTION, candidates)
+
+    assert [r["text"] for r in results] == ["passage 11", "passage 10", "passage 9"]
+    assert results[0]["rerank_score"] == 11.0
+    assert results[0]["distance"] == 11.0
+    assert "rerank_score" not in candidates[0]  # cached FAISS results are not modified
+
+
+def test_budget_keeps_faiss_order_for_unscored_passages():
+    # 25 ms budget, 10 ms per batch: 2 batches fit, the third would overrun it
+    reranker, scorer = make_reranker(budget_ms=25, top_n=12)
+    scorer.calls = 0
+
+    results = reranker.rerank(QUESTION, passages())
+
+    assert scorer.calls == 2
+    assert [r["page"] for r in results] == [7, 6, 5, 4, 3, 2, 1, 0, 8, 9, 10, 11]
+    assert [r["rerank_score"] for r in results[-4:]] == [None] * 4
+
+
+def test_no_budget_for_a_single_batch_falls_back_to_faiss_order():
+    reranker, _ = make_reranker(budget_ms=5)
+
+    assert [r["page"] for r in reranker.rerank(QUESTION, passages())] == [0, 1, 2]
+
+
+def test_model_not_loaded_or_failing_falls_back_to_faiss_order():
+    not_loaded = Reranker(lambda: None, top_n=2)
+    assert [r["page"] for r in not_loaded.rerank(QUESTION, passages())] == [0, 1]
+
+    reranker, _ = make_reranker(top_n=2)
+
+    def broken(pairs):
+        raise RuntimeError("out of memory")
+
+    reranker._scorer = broken
+    assert [r["page"] for r in reranker.rerank(QUESTION, passages())] == [0, 1]
+
+
+def test_warm_up_is_timed_with_full_length_passages():
+    clock = FakeClock()
+    seen = []
+
+    def scorer(pairs):
+        seen.extend(len(text.split()) for _, text in pairs)
+        clock.now += 0.02
+        return np.zeros(len(pairs))
+
+    reranker = Reranker(lambda: scorer, batch_size=4, clock=clock)
+    reranker.load()
+
+    assert min(seen) >= RERANK_MAX_LENGTH
+    assert reranker._batch_s == 0.02
+
+
+def test_failed_load_is_reported():
+    def missing_model():
+        raise OSError("model not found")
+
+    reranker = Reranker(missing_model)
+    reranker.start_loading().join(timeout=5)
+
+    assert not reranker.ready
+    assert "model not found" in reranker.load_error
+
+
+def test_ready_reports_the_rerank_load_error(monkeypatch):
+    def missing_model():
+        raise OSError("model not found")
+
+    reranker = Reranker(missing_model)
+    reranker.load()
+    monkeypatch.setattr(app_module, "reranker", reranker)
+    monkeypatch.setattr(app_module, "RERANK_ENABLED", True)
+    monkeypatch.setattr(app_module, "PINNED_COLLECTIONS", [])
+
+    body = TestClient(app_module.app).get("/ready").json()
+
+    assert body["rerank"]["enabled"] is True
+    assert body["rerank"]["ready"] is False
+    assert "model not found" in body["rerank"]["load_error"]
+
+
+class RankedCollection:
+    memory_bytes = 100
+
+    def __init__(self):
+        self.index = SimpleNamespace(ntotal=12)
+        self.top_k = None
+
+    def query(self, text, top_k=5):
+        self.top_k = top_k
+        return passages(top_k)
+
+
+def test_ask_sends_only_reranked_passages_to_gemini(monkeypatch):
+    collection = RankedCollection()
+    store = CollectionStore(loader=lambda cid: collection, pinned=())
+    monkeypatch.setattr(app_module, "collection_store", store)
+    monkeypatch.setattr(app_module, "RERANK_ENABLED", True)
+    monkeypatch.setattr(app_module, "RERANK_CANDIDATES", 12)
+    monkeypatch.setattr(app_module, "reranker", make_reranker(top_n=3)[0])
+
+    prompts = []
+
+    def generate(question, passages_text):
+        prompts.append(passages_text)
+        return "answer"
+
+    monkeypatch.setattr(app_module, "generate_answer", generate)
+
+    body = TestClient(app_module.app).post(
+        "/ask", json={"question": QUESTION, "top_k": 5, "rerank": True, "include_timings": True}
+    ).json()
+
+    assert collection.top_k == 12
+    assert prompts == [["passage 11", "passage 10", "passage 9"]]
+    assert [p["rerank_score"] for p in body["passages"]] == [11.0, 10.0, 9.0]
+    assert "rerank" in body["timings"]
+
+
+def test_clients_cannot_enable_rerank_on_a_deployment_without_it(monkeypatch):
+    collection = RankedCollection()
+    store = CollectionStore(loader=lambda cid: collection, pinned=())
+    monkeypatch.setattr(app_module, "collection_store", store)
+    monkeypatch.setattr(app_module, "RERANK_ENABLED", False)
+
+    def no_model():
+        raise AssertionError("the model must not be loaded")
+
+    reranker = Reranker(no_model)
+    monkeypatch.setattr(app_module, "reranker", reranker)
+    monkeypatch.setattr(app_module, "generate_answer", lambda question, passages_text: "answer")
+
+    body = TestClient(app_module.app).post("/ask", json={"question": QUESTION, "top_k": 5, "rerank": True}).json()
+
+    assert collection.top_k == 5
+    assert [p["rerank_score"] for p in body["passages"]] == [None] * 5
+    assert reranker._loader is None
@@ -0,0 +1,214 @@
+import threading
+import time
+
+import pytest
+
+import rag.gemini_client as gemini_client
+from rag.llm_wrapper import generate_answer
+from rag.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientCaller,
+    UpstreamError,
+    UpstreamTimeoutError,
+)
+
+
+class FakeAPIError(Exception):
+    """Stands in for google.api_core exceptions (HTTP status in .code)."""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class StubUpstream:
+    """
+    Local stand-in for a Gemini endpoint. Each call takes the next
+    (delay_s, error) step; after the script runs out it answers "ok".
+    """
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self._lock:
+            self.calls.append(timeout)
+            delay, error = self.steps.pop(0) if self.steps else (0.0, None)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return "ok"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_caller(**kwargs):
+    defaults = dict(timeout_s=0.2, deadline_s=1.0, max_attempts=3, backoff_base_s=0.01, backoff_max_s=0.02)
+    defaults.update(kwargs)
+    return ResilientCaller("test", **defaults)
+
+
+def test_slow_call_is_cut_at_the_deadline():
+    stub = StubUpstream(*[(1.0, None)] * 5)
+    caller = make_caller(timeout_s=0.1, deadline_s=0.3)
+
+    start = time.monotonic()
+    with pytest.raises(UpstreamTimeoutError):
+        caller.call(stub)
+
+    assert time.monotonic() - start < 0.45
+    assert all(t <= 0.1 for t in stub.calls)  # attempt timeout is passed down to the request
+
+
+def test_retries_transient_errors_then_succeeds():
+    stub = StubUpstream((0.0, FakeAPIError(503)), (0.0, FakeAPIError(429)))
+
+    assert make_caller().call(stub) == "ok"
+    assert len(stub.calls) == 3
+
+
+def test_does_not_retry_client_errors():
+    stub = StubUpstream((0.0, FakeAPIError(400)))
+
+    with pytest.raises(UpstreamError) as exc_info:
+        make_caller().call(stub)
+
+    assert not isinstance(exc_info.value, UpstreamTimeoutError)
+    assert isinstance(exc_info.value.__cause__, FakeAPIError)
+    assert len(stub.calls) == 1
+
+
+def test_gives_up_after_max_attempts():
+    stub = StubUpstream(*[(0.0, FakeAPIError(500))] * 5)
+
+    with pytest.raises(UpstreamError):
+        make_caller(max_attempts=2).call(stub)
+
+    assert len(stub.calls) == 2
+
+
+def test_hedged_request_wins_over_slow_first_request():
+    stub = StubUpstream((0.8, None), (0.0, None))
+    caller = make_caller(timeout_s=1.0, deadline_s=2.0, hedge_after_s=0.05)
+
+    start = time.monotonic()
+    assert caller.call(stub) == "ok"
+
+    assert time.monotonic() - start < 0.5
+    assert len(stub.calls) == 2
+
+
+def test_hedging_can_be_disabled_per_call():
+    stub = StubUpstream((0.2, None))
+    caller = make_caller(timeout_s=1.0, hedge_after_s=0.05)
+
+    assert caller.call(stub, hedge=False) == "ok"
+    assert len(stub.calls) == 1
+
+
+def test_time_queued_for_a_worker_does_not_count_against_the_attempt_timeout():
+    caller = make_caller(timeout_s=0.1, deadline_s=1.0, max_workers=1)
+    busy = caller._pool.submit(time.sleep, 0.08)  # the only worker thread
+
+    queued = StubUpstream((0.05, None))  # ~0.08 s in the queue, then 0.05 s running
+    assert caller.call(queued, hedge=False) == "ok"
+    assert busy.done()
+    assert len(queued.calls) == 1
+
+
+def test_saturated_pool_hits_the_deadline_without_tripping_the_breaker():
+    caller = make_caller(timeout_s=0.5, deadline_s=0.1, max_workers=1,
+                         breaker=CircuitBreaker("test", failure_threshold=1))
+    caller._pool.submit(time.sleep, 0.3)
+
+    with pytest.raises(UpstreamTimeoutError):
+        caller.call(StubUpstream(), hedge=False)
+    assert caller.breaker.state == "closed"
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_after_s=10.0, clock=clock)
+    caller = make_caller(max_attempts=1, breaker=breaker)
+    failing = StubUpstream(*[(0.0, FakeAPIError(503))] * 2)
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            caller.call(failing)
+    assert breaker.state == "open"
+
+    healthy = StubUpstream()
+    with pytest.raises(CircuitOpenError) as exc_info:
+        caller.call(healthy)
+    assert healthy.calls == []  # rejected without touching upstream
+    assert exc_info.value.retry_after == pytest.approx(10.0)
+
+    clock.now = 10.0
+    assert breaker.state == "half_open"
+    assert caller.call(healthy) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_half_open_trial_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after_s=5.0, clock=clock)
+    caller = make_caller(max_attempts=1, breaker=breaker)
+
+    with pytest.raises(UpstreamError):
+        caller.call(StubUpstream((0.0, FakeAPIError(503))))
+    clock.now = 5.0
+    with pytest.raises(UpstreamError):
+        caller.call(StubUpstream((0.0, FakeAPIError(503))))
+
+    assert breaker.state == "open"
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.request_options = []
+
+    def generate_content(self, prompt, request_options=None, **kwargs):
+        self.request_options.append(request_options)
+        return StubResponse(self.upstream(request_options["timeout"]))
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    def install(*steps):
+        model = StubModel(StubUpstream(*steps))
+        monkeypatch.setattr(gemini_client, "get_model", lambda name: model)
+        monkeypatch.setattr(gemini_client, "generate_caller", make_caller(max_attempts=2))
+        return model
+
+    return install
+
+
+def test_generate_answer_goes_through_resilient_caller(stub_model):
+    model = stub_model((0.0, FakeAPIError(503)))
+
+    assert generate_answer("What is MapReduce?", ["MapReduce splits work."]) == "ok"
+    assert len(model.upstream.calls) == 2
+    # SDK-level retries are disabled so only our deadline applies
+    assert model.request_options[0]["retry"] is None
+
+
+def test_generate_answer_raises_instead_of_returning_error_text(stub_model):
+    stub_model((0.0, FakeAPIError(500)), (0.0, FakeAPIError(500)))
+
+    with pytest.raises(UpstreamError):
+        generate_answer("What is MapReduce?", ["MapReduce splits work."])
@@ -0,0 +1,108 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import rag.app as app_module
+from rag.collection_store import CollectionStore
+from rag.query_faiss import FAISSQuery, embedding_cache
+
+DIM = 8
+QUERY = "what is a hypervisor?"
+
+
+@pytest.fixture
+def collection(tmp_path):
+    """
+    20 passages at squared distances 0, 1, 4, 9, ... from the query vector.
+    The query embedding is pre-cached, so no Gemini call is made.
+    """
+    vectors = np.zeros((20, DIM), dtype=np.float32)
+    vectors[:, 0] = np.arange(20)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(20)  # stored out of distance order
+
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors[order])
+    faiss.write_index(index, str(tmp_path / "faiss_index.bin"))
+
+    metadata = [
+        {"text": f"passage {i}", "source": "w1.pdf", "page": int(i), "title": "W1"} for i in order
+    ]
+    with open(tmp_path / "faiss_metadata.json", "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+
+    embedding_cache.put(QUERY, np.zeros((1, DIM), dtype=np.float32))
+    return FAISSQuery(str(tmp_path / "faiss_index.bin"), str(tmp_path / "faiss_metadata.json"))
+
+
+def test_range_query_returns_every_passage_within_threshold(collection):
+    results = collection.range_query(QUERY, max_distance=10.0)
+
+    assert [r["text"] for r in results] == ["passage 0", "passage 1", "passage 2", "passage 3"]
+    assert all(r["distance"] < 10.0 for r in results)
+
+
+def test_range_query_is_capped(collection):
+    assert len(collection.range_query(QUERY, max_distance=1e9, max_results=5)) == 5
+
+
+def test_range_query_falls_back_for_sharded_index(collection):
+    flat = collection.index
+    shards = faiss.IndexShards(DIM, True, True)
+    shards.add_shard(flat)
+    collection.index = shards
+
+    results = collection.range_query(QUERY, max_distance=10.0)
+
+    assert [r["text"] for r in results] == ["passage 0", "passage 1", "passage 2", "passage 3"]
+
+
+@pytest.fixture
+def client(collection, monkeypatch):
+    store = CollectionStore(loader=lambda cid: collection, pinned=())
+    monkeypatch.setattr(app_module, "collection_store", store)
+
+    def no_generation(*args, **kwargs):
+        raise AssertionError("/search must not call Gemini generation")
+
+    monkeypatch.setattr(app_module, "generate_answer", no_generation)
+    return TestClient(app_module.app)
+
+
+def test_search_paginates_top_k(client):
+    first = client.post("/search", json={"query": QUERY, "top_k": 5, "limit": 2}).json()
+    last = client.post("/search", json={"query": QUERY, "top_k": 5, "limit": 2, "offset": 4}).json()
+
+    assert [p["text"] for p in first["passages"]] == ["passage 0", "passage 1"]
+    assert first["total"] == 5
+    assert first["next_offset"] == 2
+    assert [p["text"] for p in last["passages"]] == ["passage 4"]
+    assert last["next_offset"] is None
+
+
+def test_only_the_first_page_is_counted_in_the_query_log(client, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(app_module, "record_query", lambda collection_id, question: recorded.append(question))
+
+    for offset in (0, 2, 4):
+        client.post("/search", json={"query": QUERY, "top_k": 5, "limit": 2, "offset": offset})
+
+    assert recorded == [QUERY]
+
+
+def test_search_with_distance_threshold(client):
+    response = client.post("/search", json={"query": QUERY, "max_distance": 20.0, "include_timings": True})
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["total"] == 5
+    assert [p["page"] for p in body["passages"]] == [0, 1, 2, 3, 4]
+    assert "search" in body["timings"]
+
+
+def test_search_validates_paging(client):
+    assert client.post("/search", json={"query": QUERY, "limit": 0}).status_code == 422
+    assert client.post("/search", json={"query": QUERY, "max_distance": -1}).status_code == 422
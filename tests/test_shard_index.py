@@ -0,0 +1,88 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from rag.query_faiss import read_index, shard_manifest_path
+from src.quantize import save_embeddings
+from src.shard_index import build_sharded_index, plan_shards
+
+DIM = 16
+
+
+@pytest.fixture
+def embeddings(tmp_path):
+    emb = np.random.default_rng(0).standard_normal((3000, DIM)).astype(np.float32)
+    path = tmp_path / "embeddings.npy"
+    np.save(path, emb)
+    return emb, str(path)
+
+
+def exact_top_k(emb, queries, k):
+    index = faiss.IndexFlatL2(DIM)
+    index.add(emb)
+    return index.search(queries, k)[1]
+
+
+def test_merged_flat_build_matches_single_process_index(embeddings, tmp_path):
+    emb, path = embeddings
+    out = str(tmp_path / "faiss_index.bin")
+
+    summary = build_sharded_index(path, out, "Flat", "merge", workers=2, memory_mb=0.2)
+
+    assert summary["shards"] > 2
+    index, _ = read_index(out)
+    assert index.ntotal == len(emb)
+    np.testing.assert_array_equal(index.search(emb[:50], 5)[1], exact_top_k(emb, emb[:50], 5))
+
+
+def test_shards_are_served_with_merged_top_k(embeddings, tmp_path):
+    emb, path = embeddings
+    out = str(tmp_path / "faiss_index.bin")
+
+    summary = build_sharded_index(path, out, "Flat", "shards", workers=2, memory_mb=0.2)
+
+    with open(shard_manifest_path(out), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert len(manifest["shards"]) == summary["shards"]
+    assert sum(s["ntotal"] for s in manifest["shards"]) == len(emb)
+
+    index, size = read_index(out)
+    assert isinstance(index, faiss.IndexShards)
+    assert size > 0
+    # ids are global: they still point into the metadata order
+    np.testing.assert_array_equal(index.search(emb[:50], 5)[1], exact_top_k(emb, emb[:50], 5))
+
+
+def test_trained_index_shards_share_one_quantizer(embeddings, tmp_path):
+    emb, path = embeddings
+    out = str(tmp_path / "faiss_index.bin")
+
+    build_sharded_index(path, out, "IVF16,Flat", "merge", workers=2, memory_mb=0.2, train_sample=2000)
+
+    index, _ = read_index(out)
+    index.nprobe = 16  # all lists → exact
+    np.testing.assert_array_equal(index.search(emb[:50], 5)[1], exact_top_k(emb, emb[:50], 5))
+
+
+def test_streams_quantized_embeddings(embeddings, tmp_path):
+    emb, path = embeddings
+    int8_path = save_embeddings(emb, path, "int8")[0]
+    out = str(tmp_path / "faiss_index.bin")
+
+    build_sharded_index(int8_path, out, "Flat", "merge", workers=1, memory_mb=0.2)
+
+    index, _ = read_index(out)
+    assert index.ntotal == len(emb)
+
+
+def test_plan_respects_memory_budget():
+    shard_rows, chunk_rows = plan_shards(n=10_000_000, dim=768, vector_bytes=768 * 4, workers=4, memory_mb=1024)
+
+    per_worker = shard_rows * 768 * 4 + chunk_rows * 768 * 4 * 2
+    assert per_worker * 4 <= 1024 * 1024 * 1024
+    assert chunk_rows <= shard_rows
+
+    with pytest.raises(ValueError):
+        plan_shards(n=1000, dim=768, vector_bytes=768 * 4, workers=4, memory_mb=0.01)